@@ -0,0 +1,158 @@
+import os
+import time
+import logging
+import contextvars
+from concurrent.futures import ThreadPoolExecutor, wait
+
+import data_services
+import indicator_bundle
+from services import marketdata_service
+from services.rate_limiter import current_priority, PRIORITY_INTERACTIVE
+
+logger = logging.getLogger(__name__)
+
+ANALYZE_DEADLINE_SECONDS = float(os.environ.get('ANALYZE_DEADLINE_SECONDS', 8))
+ANALYZE_FETCH_WORKERS = int(os.environ.get('ANALYZE_FETCH_WORKERS', 16))
+
+# Scanner and prefetch analyses have no deadline and queue on their own pool, never on the interactive one
+BACKGROUND_FETCH_WORKERS = int(os.environ.get('BACKGROUND_FETCH_WORKERS', 8))
+
+fetch_executor = ThreadPoolExecutor(max_workers=ANALYZE_FETCH_WORKERS, thread_name_prefix='analyze-fetch')
+background_executor = ThreadPoolExecutor(max_workers=BACKGROUND_FETCH_WORKERS, thread_name_prefix='background-fetch')
+
+# Fetched inputs each pillar depends on; a pillar is degraded if any of them misses the deadline
+PILLAR_INPUTS = {
+    'analyst_ratings': ('analyst_data',),
+    'technicals': ('hist_df',),
+    'value': ('price_targets', 'key_metrics'),
+    'macro': ('fred_df',),
+    'event_risk': ('earnings',),
+}
+
+
+class AnalysisContext:
+    """
+    Request-scoped inputs for one analysis. Each provider input is fetched at
+    most once, concurrently and under one ANALYZE_DEADLINE_SECONDS deadline, and
+    the same objects are then shared by scoring and response serialization.
+    Inputs that were still running (or failed) at the deadline are None and
+    listed in `missed`; late fetches keep running and still fill the caches.
+    
+    Contexts created at scanner or prefetch priority wait for every input, like
+    their rate-limiter calls do, and run on background_executor instead.
+    """
+
+    def __init__(self, ticker):
+        self.ticker = ticker.upper()
+        self.inputs = {}
+        self.missed = set()
+        self.fetched = False
+        self._indicators = None
+        interactive = current_priority() == PRIORITY_INTERACTIVE
+        self.deadline_seconds = ANALYZE_DEADLINE_SECONDS if interactive else None
+        self._executor = fetch_executor if interactive else background_executor
+
+    def _fetchers(self):
+        ticker = self.ticker
+        return {
+            'realtime_data': lambda: marketdata_service.get_realtime_price(ticker),
+            'profile': lambda: data_services.get_stock_profile(ticker),
+            'hist_df': lambda: data_services.get_historical_prices(ticker, days=730),
+            'analyst_data': lambda: data_services.get_analyst_recommendations(ticker),
+            'price_targets': lambda: data_services.get_analyst_price_targets(ticker),
+            'key_metrics': lambda: data_services.get_key_metrics(ticker),
+            'earnings': lambda: data_services.get_earnings_calendar(ticker),
+            'fred_df': data_services.get_fred_data,
+        }
+
+    def _submit(self, fetch):
+        # Each task runs in a copy of the caller's context so the rate-limit priority carries over
+        return self._executor.submit(contextvars.copy_context().run, fetch)
+
+    def _collect(self, futures):
+        for name, future in futures.items():
+            if not future.done():
+                logger.warning(f"{name} fetch for {self.ticker} missed the {self.deadline_seconds}s deadline")
+                future.cancel()
+                self.missed.add(name)
+                self.inputs[name] = None
+                continue
+            try:
+                self.inputs[name] = future.result()
+            except Exception as e:
+                logger.error(f"{name} fetch for {self.ticker} failed: {e}")
+                self.missed.add(name)
+                self.inputs[name] = None
+
+    def fetch(self):
+        """Fetch every input once; later calls are no-ops."""
+        if self.fetched:
+            return self
+        timeout = self.deadline_seconds
+        deadline = None if timeout is None else time.monotonic() + timeout
+
+        futures = {name: self._submit(fetch) for name, fetch in self._fetchers().items()}
+        wait(futures.values(), timeout=timeout)
+        self._collect(futures)
+
+        # The quote is built from the real-time price and profile fetched above; only
+        # when the real-time call failed do we fall back to the (cached) quote lookup.
+        realtime_data = self.inputs['realtime_data']
+        if realtime_data:
+            self.inputs['quote'] = data_services.get_stock_quote(
+                self.ticker, price_data=realtime_data, profile=self.inputs['profile']
+            )
+        else:
+            quote_future = self._submit(lambda: data_services.get_stock_quote(self.ticker))
+            wait([quote_future], timeout=None if deadline is None else max(deadline - time.monotonic(), 0))
+            self._collect({'quote': quote_future})
+
+        self.fetched = True
+        return self
+
+    def degraded_pillars(self):
+        return [pillar for pillar, names in PILLAR_INPUTS.items() if self.missed.intersection(names)]
+
+    @property
+    def quote(self):
+        return self.inputs.get('quote')
+
+    @property
+    def realtime_data(self):
+        return self.inputs.get('realtime_data')
+
+    @property
+    def profile(self):
+        return self.inputs.get('profile')
+
+    @property
+    def hist_df(self):
+        return self.inputs.get('hist_df')
+
+    @property
+    def indicators(self):
+        """The candles' shared indicator bundle (indicator_bundle.get_bundle), or None without candles."""
+        hist_df = self.hist_df
+        if self._indicators is None and hist_df is not None and len(hist_df) > 0:
+            self._indicators = indicator_bundle.get_bundle(self.ticker, hist_df)
+        return self._indicators
+
+    @property
+    def analyst_data(self):
+        return self.inputs.get('analyst_data')
+
+    @property
+    def price_targets(self):
+        return self.inputs.get('price_targets')
+
+    @property
+    def key_metrics(self):
+        return self.inputs.get('key_metrics')
+
+    @property
+    def earnings(self):
+        return self.inputs.get('earnings')
+
+    @property
+    def fred_df(self):
+        return self.inputs.get('fred_df')
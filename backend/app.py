@@ -10,17 +10,23 @@ import hashlib
 from datetime import datetime, timedelta
 from sqlalchemy import func
 
-from data_services import (
-    get_stock_quote, get_stock_profile, get_historical_prices,
-    get_analyst_recommendations, get_analyst_price_targets,
-    get_key_metrics, get_earnings_calendar, get_fred_data, get_spy_data
-)
+import data_services
+from data_services import get_fred_data, get_spy_data
+from analysis_context import AnalysisContext
+from technicals_batch import score_technicals_batch
+import indicator_state
+import indicator_bundle
+import payloads
 from scoring_engine import (
-    score_analyst_ratings, score_technicals, score_value, score_macro,
+    score_analyst_ratings, score_value, get_macro_score,
     score_event_risk, calculate_final_score, get_verdict
 )
-from services.marketdata_service import get_realtime_price
 from services.scanner import run_scanner
+from services import finnhub_service
+from services import rate_limiter
+from services import circuit_breaker
+from services import earnings_index
+from services.cache_warmer import start_warm, warm_status, get_watchlist_tickers, get_top_traffic_tickers
 
 logging.basicConfig(level=logging.DEBUG)
 logger = logging.getLogger(__name__)
@@ -77,22 +83,40 @@ def track_traffic():
         db.session.rollback()
 
 
-def analyze_stock_internal(ticker):
+def degraded_pillar():
+    """Neutral fallback for a pillar whose inputs were not available in time."""
+    return 5.0, {'error': 'Data unavailable (provider timeout)', 'degraded': True}
+
+
+def analyze_stock_internal(ticker, context=None, technicals=None):
+    """
+    Score one ticker. Pass an AnalysisContext to reuse its fetched inputs afterwards
+    (e.g. the candles for the price history payload) instead of fetching them again,
+    and a precomputed (score, details) technicals result from a batch run.
+    """
     ticker = ticker.upper()
     
-    quote = get_stock_quote(ticker)
+    if context is None:
+        context = AnalysisContext(ticker)
+    context.fetch()
+    
+    quote = context.quote
     if not quote:
+        if 'quote' in context.missed or 'realtime_data' in context.missed:
+            return {'error': 'Market data providers timed out. Please try again.', 'timed_out': True}
         return {'error': 'Invalid ticker symbol or no data available'}
     
-    profile = get_stock_profile(ticker)
-    hist_df = get_historical_prices(ticker, days=730)
-    analyst_data = get_analyst_recommendations(ticker)
-    price_targets = get_analyst_price_targets(ticker)
-    key_metrics = get_key_metrics(ticker)
-    earnings = get_earnings_calendar(ticker)
-    fred_df = get_fred_data()
+    profile = context.profile
+    hist_df = context.hist_df
+    analyst_data = context.analyst_data
+    price_targets = context.price_targets
+    key_metrics = context.key_metrics
+    earnings = context.earnings
+    fred_df = context.fred_df
     
-    realtime_data = get_realtime_price(ticker)
+    degraded = context.degraded_pillars()
+    
+    realtime_data = context.realtime_data
     if realtime_data:
         current_price = realtime_data.get('price', 0)
         price_change = realtime_data.get('change', 0)
@@ -116,11 +140,27 @@ def analyze_stock_internal(ticker):
         analyst_data.get('recommendations') if analyst_data else None,
         analyst_data.get('last_upgrade') if analyst_data else None
     )
-    technicals_score, technicals_details = score_technicals(hist_df)
+    if technicals is not None:
+        technicals_score, technicals_details = technicals
+    elif context.indicators is not None:
+        technicals_score, technicals_details = context.indicators['technicals']
+    else:
+        technicals_score, technicals_details = indicator_state.score_technicals_incremental(ticker, hist_df)
     value_score, value_details = score_value(price_targets, key_metrics, current_price, week52_high)
-    macro_score, macro_details = score_macro(fred_df)
+    macro_score, macro_details = get_macro_score(fred_df)
     event_risk_score, event_risk_details = score_event_risk(earnings)
     
+    if 'analyst_ratings' in degraded:
+        analyst_score, analyst_details = degraded_pillar()
+    if 'technicals' in degraded:
+        technicals_score, technicals_details = degraded_pillar()
+    if 'value' in degraded:
+        value_score, value_details = degraded_pillar()
+    if 'macro' in degraded:
+        macro_score, macro_details = degraded_pillar()
+    if 'event_risk' in degraded:
+        event_risk_score, event_risk_details = degraded_pillar()
+    
     is_blackout = event_risk_details.get('blackout', False)
     
     final_score = calculate_final_score(
@@ -153,6 +193,7 @@ def analyze_stock_internal(ticker):
         'price_change_percent': round(price_change_percent, 2) if price_change_percent else 0,
         'price_source': price_source,
         'total_score': final_score,
+        'degraded_pillars': degraded,
         'verdict': verdict,
         'verdict_type': verdict_type,
         'action_card': {
@@ -166,94 +207,74 @@ def analyze_stock_internal(ticker):
                 'score': analyst_score,
                 'weight': 10,
                 'name': 'Analyst Ratings',
-                'details': analyst_details
+                'details': analyst_details,
+                'degraded': 'analyst_ratings' in degraded
             },
             'technicals': {
                 'score': technicals_score,
                 'weight': 40,
                 'name': 'Technical Structure',
-                'details': technicals_details
+                'details': technicals_details,
+                'degraded': 'technicals' in degraded
             },
             'value': {
                 'score': value_score,
                 'weight': 15,
                 'name': 'Relative Value',
-                'details': value_details
+                'details': value_details,
+                'degraded': 'value' in degraded
             },
             'macro': {
                 'score': macro_score,
                 'weight': 25,
                 'name': 'Macro Liquidity',
-                'details': macro_details
+                'details': macro_details,
+                'degraded': 'macro' in degraded
             },
             'event_risk': {
                 'score': event_risk_score,
                 'weight': 10,
                 'name': 'Event Risk',
-                'details': event_risk_details
+                'details': event_risk_details,
+                'degraded': 'event_risk' in degraded
             }
         }
     }
 
 
+def prepare_scan(tickers):
+    """
+    Fetch every ticker's inputs, then score technicals for the whole universe in
+    one vectorized pass; returns analyze_stock_internal kwargs per ticker.
+    """
+    contexts = {ticker: AnalysisContext(ticker).fetch() for ticker in tickers}
+    technicals = score_technicals_batch({
+        ticker: context.hist_df for ticker, context in contexts.items()
+        if 'technicals' not in context.degraded_pillars()
+    })
+    return {
+        ticker: {'context': context, 'technicals': technicals.get(ticker)}
+        for ticker, context in contexts.items()
+    }
+
+
 @app.route('/api/analyze/<path:ticker>', methods=['GET'])
 def analyze_stock(ticker):
     try:
-        result = analyze_stock_internal(ticker)
+        context = AnalysisContext(ticker)
+        result = analyze_stock_internal(ticker, context)
         
         if 'error' in result:
+            # A timeout says nothing about the symbol; only a genuinely unknown ticker is a 404
+            if result.pop('timed_out', False):
+                return jsonify(result), 504
             return jsonify(result), 404
         
-        hist_df = get_historical_prices(ticker.upper(), days=730)
+        hist_df = context.hist_df
         price_history = []
         if hist_df is not None and len(hist_df) > 0:
-            from scoring_engine import calculate_rsi_series, calculate_macd_series
-            
-            close_prices = hist_df['close']
-            rsi_series = calculate_rsi_series(close_prices, period=14)
-            macd_series, signal_series = calculate_macd_series(close_prices)
-            histogram_series = macd_series - signal_series
-            
-            volume_sma = hist_df['volume'].rolling(20).mean() if 'volume' in hist_df.columns else None
-            
-            sma_50 = close_prices.rolling(window=50).mean()
-            sma_200 = close_prices.rolling(window=200).mean()
-            
-            for i, (_, row) in enumerate(hist_df.iterrows()):
-                entry = {
-                    'date': row['date'].strftime('%Y-%m-%d') if hasattr(row['date'], 'strftime') else str(row['date'])[:10],
-                    'price': round(row['close'], 2),
-                    'open': round(row['open'], 2) if 'open' in row else None,
-                    'high': round(row['high'], 2) if 'high' in row else None,
-                    'low': round(row['low'], 2) if 'low' in row else None,
-                }
-                
-                if i < len(rsi_series) and not pd.isna(rsi_series.iloc[i]):
-                    entry['rsi'] = round(float(rsi_series.iloc[i]), 2)
-                
-                if i < len(macd_series) and not pd.isna(macd_series.iloc[i]):
-                    entry['macd'] = round(float(macd_series.iloc[i]), 4)
-                
-                if i < len(signal_series) and not pd.isna(signal_series.iloc[i]):
-                    entry['macd_signal'] = round(float(signal_series.iloc[i]), 4)
-                
-                if i < len(histogram_series) and not pd.isna(histogram_series.iloc[i]):
-                    entry['histogram'] = round(float(histogram_series.iloc[i]), 4)
-                
-                if 'volume' in hist_df.columns:
-                    entry['volume'] = int(row['volume'])
-                    if volume_sma is not None and i < len(volume_sma) and not pd.isna(volume_sma.iloc[i]):
-                        entry['volume_sma'] = int(volume_sma.iloc[i])
-                
-                if i < len(sma_50) and not pd.isna(sma_50.iloc[i]):
-                    entry['sma_50'] = round(float(sma_50.iloc[i]), 2)
-                
-                if i < len(sma_200) and not pd.isna(sma_200.iloc[i]):
-                    entry['sma_200'] = round(float(sma_200.iloc[i]), 2)
-                
-                price_history.append(entry)
-            
-            price_history = price_history[-365:]
+            # Same bundle the technicals pillar was scored from; nothing is recomputed here
+            price_history = payloads.build_price_history(hist_df, context.indicators['series'])
         
         result['final_score'] = result.pop('total_score')
         result['price_history'] = price_history
@@ -266,7 +287,6 @@ def analyze_stock(ticker):
 
 @app.route('/api/macro/net-liquidity', methods=['GET'])
 def get_net_liquidity():
-    import pandas as pd
     try:
         fred_df = get_fred_data()
         spy_df = get_spy_data()
@@ -274,48 +294,7 @@ def get_net_liquidity():
         if fred_df is None:
             return jsonify({'error': 'Unable to fetch FRED data'}), 500
         
-        fred_df = fred_df.copy()
-        fred_df.index = pd.to_datetime(fred_df.index).tz_localize(None).normalize()
-        
-        if spy_df is not None:
-            spy_df = spy_df.copy()
-            spy_df.index = pd.to_datetime(spy_df.index).tz_localize(None).normalize()
-            spy_df = spy_df[~spy_df.index.duplicated(keep='first')]
-            spy_reindexed = spy_df['close'].reindex(fred_df.index, method='ffill')
-            fred_df['spy_close'] = spy_reindexed
-        
-        fred_df = fred_df.dropna(subset=['net_liquidity'])
-        
-        if len(fred_df) > 0:
-            liq_start = fred_df['net_liquidity'].iloc[0]
-            fred_df['net_liquidity_norm'] = (fred_df['net_liquidity'] / liq_start) * 100
-            
-            if 'spy_close' in fred_df.columns:
-                fred_df_with_spy = fred_df.dropna(subset=['spy_close'])
-                if len(fred_df_with_spy) > 0:
-                    spy_start = fred_df_with_spy['spy_close'].iloc[0]
-                    fred_df['spy_norm'] = (fred_df['spy_close'] / spy_start) * 100
-        
-        data = []
-        for date, row in fred_df.iterrows():
-            entry = {
-                'date': date.strftime('%Y-%m-%d'),
-                'net_liquidity': round(float(row['net_liquidity']) / 1000000, 2),
-                'net_liquidity_norm': round(float(row.get('net_liquidity_norm', 100)), 2)
-            }
-            
-            if 'spy_close' in row.index and pd.notna(row['spy_close']):
-                entry['spy_price'] = round(float(row['spy_close']), 2)
-            if 'spy_norm' in row.index and pd.notna(row['spy_norm']):
-                entry['spy_norm'] = round(float(row['spy_norm']), 2)
-            
-            data.append(entry)
-        
-        return jsonify({
-            'data': data[-90:],
-            'current_net_liquidity': round(float(fred_df['net_liquidity'].iloc[-1]) / 1000000, 2),
-            'credit_spread': round(float(fred_df['credit_spreads'].iloc[-1]), 2)
-        })
+        return jsonify(payloads.get_net_liquidity(fred_df, spy_df))
     
     except Exception as e:
         logger.error(f"Error fetching net liquidity: {e}")
@@ -607,6 +586,46 @@ def admin_get_traffic_stats():
         return jsonify({'error': 'Failed to fetch traffic stats'}), 500
 
 
+@app.route('/api/admin/cache-stats', methods=['GET'])
+def admin_get_cache_stats():
+    password = request.headers.get('X-Admin-Password', '')
+    admin_password = os.environ.get('ADMIN_PASSWORD')
+    
+    if not admin_password or password != admin_password:
+        return jsonify({'error': 'Unauthorized'}), 401
+    
+    return jsonify({
+        'data': {
+            'cache': data_services.cache.stats(),
+            'single_flight': data_services.flight.stats()
+        },
+        'finnhub': {
+            'cache': finnhub_service.cache.stats(),
+            'single_flight': finnhub_service.flight.stats()
+        },
+        'earnings_index': earnings_index.stats(),
+        'indicators': {
+            'cache': indicator_bundle.cache.stats(),
+            'single_flight': indicator_bundle.flight.stats()
+        },
+        'indicator_state': indicator_state.stats()
+    })
+
+
+@app.route('/api/admin/provider-usage', methods=['GET'])
+def admin_get_provider_usage():
+    password = request.headers.get('X-Admin-Password', '')
+    admin_password = os.environ.get('ADMIN_PASSWORD')
+    
+    if not admin_password or password != admin_password:
+        return jsonify({'error': 'Unauthorized'}), 401
+    
+    return jsonify({
+        'providers': rate_limiter.get_usage(),
+        'circuit_breakers': circuit_breaker.get_stats()
+    })
+
+
 @app.route('/api/admin/watchlist', methods=['GET'])
 def admin_get_watchlist():
     password = request.headers.get('X-Admin-Password', '')
@@ -756,7 +775,7 @@ def admin_run_scanner():
         data = request.get_json() or {}
         category = data.get('category')
         
-        results = run_scanner(analyze_stock_internal, category=category)
+        results = run_scanner(analyze_stock_internal, category=category, prepare_func=prepare_scan)
         return jsonify({
             'success': True,
             'scanned': results['scanned'],
@@ -770,6 +789,49 @@ def admin_run_scanner():
         return jsonify({'error': 'Scanner failed'}), 500
 
 
+@app.route('/api/admin/cache/warm', methods=['POST'])
+def admin_warm_cache():
+    password = request.headers.get('X-Admin-Password', '')
+    admin_password = os.environ.get('ADMIN_PASSWORD')
+    
+    if not admin_password or password != admin_password:
+        return jsonify({'error': 'Unauthorized'}), 401
+    
+    try:
+        data = request.get_json(silent=True) or {}
+        source = data.get('source', 'all')
+        top_n = int(data.get('top_n', 20))
+        
+        if source not in ['watchlist', 'traffic', 'all']:
+            return jsonify({'error': 'Source must be one of: watchlist, traffic, all'}), 400
+        
+        tickers = get_watchlist_tickers() if source in ['watchlist', 'all'] else []
+        if source in ['traffic', 'all']:
+            for ticker in get_top_traffic_tickers(limit=top_n):
+                if ticker not in tickers:
+                    tickers.append(ticker)
+        
+        started = start_warm(tickers)
+        status = warm_status()
+        if not started:
+            return jsonify({'success': False, 'error': 'A cache warm is already running', **status}), 409
+        return jsonify({'success': True, 'source': source, **status}), 202
+    except Exception as e:
+        logger.error(f"Cache warm error: {e}")
+        return jsonify({'error': 'Cache warm failed'}), 500
+
+
+@app.route('/api/admin/cache/warm', methods=['GET'])
+def admin_warm_cache_status():
+    password = request.headers.get('X-Admin-Password', '')
+    admin_password = os.environ.get('ADMIN_PASSWORD')
+    
+    if not admin_password or password != admin_password:
+        return jsonify({'error': 'Unauthorized'}), 401
+    
+    return jsonify(warm_status())
+
+
 @app.route('/api/admin/staging', methods=['GET'])
 def admin_get_staging():
     password = request.headers.get('X-Admin-Password', '')
@@ -1,50 +1,91 @@
 import os
-import json
+import threading
 import requests
 import pandas as pd
 import numpy as np
 from datetime import datetime, timedelta
-from cachetools import TTLCache
 from fredapi import Fred
 import logging
 from services import finnhub_service
 from services import marketdata_service
+from services import candle_store
+from services import earnings_index
+from services import rate_limiter
+from services import circuit_breaker
+from services import provider_replay
+from services.caching import SingleFlight, create_cache_backend, fetch_through
+from services.snapshots import save_npz_atomic, load_npz
+import indicator_state
 
-FRED_CACHE_FILE = os.path.join(os.path.dirname(__file__), 'fred_cache.json')
+FRED_SNAPSHOT_FILE = os.environ.get(
+    'FRED_SNAPSHOT_FILE',
+    os.path.join(os.path.dirname(__file__), 'data', 'fred_snapshot.npz')
+)
 FRED_CACHE_TTL_HOURS = 24
+# After a failed refresh, keep serving what we have for this long before asking FRED again
+FRED_RETRY_MINUTES = 15
+# Depth of the initial backfill; later refreshes only fetch newer observations
+FRED_HISTORY_DAYS = int(os.environ.get('FRED_HISTORY_DAYS', 730))
+FRED_SERIES = {
+    'walcl': 'WALCL',
+    'tga': 'WTREGEN',
+    'rrp': 'RRPONTSYD',
+    'credit_spreads': 'BAMLH0A0HYM2'
+}
+# Used when a series has no observations at all
+FRED_DEFAULTS = {
+    'walcl': 7000000,
+    'tga': 800000,
+    'rrp': 500000,
+    'credit_spreads': 3.5
+}
+FRED_COLUMNS = ('walcl', 'tga', 'rrp', 'credit_spreads', 'net_liquidity')
 
 logging.basicConfig(level=logging.DEBUG)
 logger = logging.getLogger(__name__)
 
 FRED_API_KEY = os.environ.get('FRED_API_KEY')
 
-cache = TTLCache(maxsize=100, ttl=600)
+cache = create_cache_backend('data', ttl=600)
+# Concurrent misses on the same key share one upstream fetch
+flight = SingleFlight('data')
 
-def get_cached(key, fetch_func):
-    if key in cache:
-        logger.debug(f"Cache hit for {key}")
-        return cache[key]
-    logger.debug(f"Cache miss for {key}, fetching...")
-    data = fetch_func()
-    if data is not None:
-        cache[key] = data
-    return data
+def get_cached(key, fetch_func, covers=None, flight_key=None, refresh_func=None):
+    return fetch_through(cache, flight, key, fetch_func, covers=covers, flight_key=flight_key, refresh_func=refresh_func)
 
-def get_stock_quote(ticker):
-    """Get stock quote using MarketData real-time price."""
+def _build_quote(ticker, price_data, profile):
+    return {
+        'price': price_data.get('price'),
+        'change': price_data.get('change'),
+        'changesPercentage': price_data.get('change_percent'),
+        'name': profile.get('companyName') if profile else ticker,
+        'symbol': ticker
+    }
+
+_NOT_FETCHED = object()
+
+def get_stock_quote(ticker, price_data=None, profile=_NOT_FETCHED):
+    """
+    Get stock quote using MarketData real-time price.
+    Callers that already hold the real-time price (and profile) pass them in; the
+    quote is then built without another upstream call and refreshes the cache entry.
+    A profile passed as None (its lookup failed or missed the deadline) is not
+    fetched again: the quote falls back to the ticker as its name and is not cached.
+    """
     key = f"quote_{ticker}"
+    if price_data:
+        if profile is _NOT_FETCHED:
+            profile = finnhub_service.get_company_profile(ticker)
+        quote = _build_quote(ticker, price_data, profile)
+        if profile:
+            cache.set(key, quote)
+        return quote
     def fetch():
         try:
             price_data = marketdata_service.get_realtime_price(ticker)
-            profile = finnhub_service.get_company_profile(ticker)
             if price_data:
-                return {
-                    'price': price_data.get('price'),
-                    'change': price_data.get('change'),
-                    'changesPercentage': price_data.get('change_percent'),
-                    'name': profile.get('companyName') if profile else ticker,
-                    'symbol': ticker
-                }
+                profile = finnhub_service.get_company_profile(ticker)
+                return _build_quote(ticker, price_data, profile)
         except Exception as e:
             logger.error(f"Error fetching quote for {ticker}: {e}")
         return None
@@ -54,12 +95,42 @@ def get_stock_profile(ticker):
     """Get stock profile using Finnhub."""
     return finnhub_service.get_company_profile(ticker)
 
+def fetch_candles(ticker, days=120, from_date=None):
+    """
+    Fetch daily candles from MarketData.app, hedged with Finnhub: Finnhub answers
+    when MarketData's circuit is open, errors or returns nothing, or is still
+    running after its p95 latency, whichever provider answers first wins.
+    """
+    return circuit_breaker.hedged_call(
+        'marketdata', lambda: marketdata_service.get_historical_candles(ticker, days=days, from_date=from_date),
+        'finnhub', lambda: finnhub_service.fetch_stock_candles(ticker, days=days, from_date=from_date)
+    )
+
 def get_historical_prices(ticker, days=120):
-    """Get historical prices using MarketData.app candles."""
-    key = f"historical_{ticker}_{days}"
-    def fetch():
-        return marketdata_service.get_historical_candles(ticker, days=days)
-    return get_cached(key, fetch)
+    """
+    Get historical prices from hedged MarketData.app/Finnhub candles, topped up incrementally from the local candle store.
+    One cache entry per symbol holds the widest window fetched so far; shorter windows are sliced from it,
+    and a stale entry is refreshed at its own window, never narrowed to the caller's.
+    """
+    key = f"historical_{ticker}"
+    def fetch(window_days):
+        candles = candle_store.get_candles(ticker, window_days, fetch_candles, on_restated=indicator_state.invalidate)
+        if candles is None:
+            return None
+        # A wider window stored meanwhile (by a fetch under another flight key) is topped up, not narrowed
+        stored = cache.get_entry(key)
+        if stored is not None and stored[0]['days'] > window_days:
+            return {'days': stored[0]['days'], 'candles': candle_store.merge_candles(stored[0]['candles'], candles)}
+        return {'days': window_days, 'candles': candles}
+    entry = get_cached(
+        key, lambda: fetch(days), covers=lambda e: e['days'] >= days, flight_key=f"{key}_{days}",
+        refresh_func=lambda stale: fetch(max(days, stale['days']))
+    )
+    if entry is None:
+        return None
+    if entry['days'] == days:
+        return entry['candles']
+    return candle_store.slice_window(entry['candles'], days)
 
 def get_analyst_ratings(ticker):
     """Get analyst ratings from Finnhub."""
@@ -132,7 +203,16 @@ def get_key_metrics(ticker):
     return get_cached(key, fetch)
 
 def get_earnings_calendar(ticker):
-    """Get earnings calendar from MarketData.app."""
+    """
+    Get the next earnings date from the shared bulk earnings index, falling back
+    to a per-ticker MarketData.app lookup while no index is available or the
+    index has no upcoming report for the ticker (e.g. it is further out than
+    the index window).
+    """
+    earnings = earnings_index.get_next_earnings(ticker)
+    if earnings is not None:
+        return earnings
+    
     key = f"earnings_{ticker}"
     def fetch():
         md_earnings = marketdata_service.get_earnings_calendar(ticker)
@@ -142,110 +222,224 @@ def get_earnings_calendar(ticker):
         return []
     return get_cached(key, fetch)
 
-def _load_fred_cache():
-    """Load FRED data from file cache if valid (< 24 hours old)."""
+# Decoded FRED frame and raw observations shared by every request in this process
+_fred_frame = None
+_fred_series = {}
+_fred_timestamp = None
+_fred_last_failure = None
+_fred_lock = threading.Lock()
+
+def _fred_age_hours(timestamp):
+    return (datetime.now() - timestamp).total_seconds() / 3600
+
+def _fred_backing_off():
+    return _fred_last_failure is not None and datetime.now() - _fred_last_failure < timedelta(minutes=FRED_RETRY_MINUTES)
+
+def _load_fred_snapshot():
+    """Decode the binary FRED snapshot. Returns (df, raw series dict, fetched_at) or (None, {}, None)."""
     try:
-        if os.path.exists(FRED_CACHE_FILE):
-            with open(FRED_CACHE_FILE, 'r') as f:
-                cache_data = json.load(f)
-            
-            cached_time = datetime.fromisoformat(cache_data.get('timestamp', '2000-01-01'))
-            age_hours = (datetime.now() - cached_time).total_seconds() / 3600
-            
-            if age_hours < FRED_CACHE_TTL_HOURS:
-                logger.info(f"FRED cache hit - age: {age_hours:.1f} hours")
-                df = pd.DataFrame(cache_data['data'])
-                df['date'] = pd.to_datetime(df['date'])
-                df = df.set_index('date')
-                return df
-            else:
-                logger.info(f"FRED cache expired - age: {age_hours:.1f} hours")
+        arrays = load_npz(FRED_SNAPSHOT_FILE)
+        if arrays is None:
+            return None, {}, None
+        index = pd.DatetimeIndex(pd.to_datetime(arrays['date'], unit='ns'), name='date')
+        df = pd.DataFrame({column: arrays[column] for column in FRED_COLUMNS}, index=index)
+        series = {}
+        for column in FRED_SERIES:
+            if f'{column}_dates' in arrays:
+                series[column] = pd.Series(
+                    arrays[f'{column}_values'],
+                    index=pd.to_datetime(arrays[f'{column}_dates'], unit='ns')
+                )
+        return df, series, datetime.fromisoformat(str(arrays['timestamp']))
     except Exception as e:
-        logger.warning(f"Error loading FRED cache: {e}")
-    return None
+        logger.warning(f"Error loading FRED snapshot: {e}")
+    return None, {}, None
 
-def _save_fred_cache(df):
-    """Save FRED data to file cache with timestamp."""
+def _save_fred_snapshot(df, series, fetched_at):
+    """Write the FRED frame and raw series to the binary snapshot atomically (temp file + rename)."""
     try:
-        df_reset = df.reset_index()
-        df_reset['date'] = df_reset['date'].astype(str)
-        cache_data = {
-            'timestamp': datetime.now().isoformat(),
-            'data': df_reset.to_dict(orient='records')
+        arrays = {
+            'date': df.index.values.astype('datetime64[ns]').astype(np.int64),
+            'timestamp': np.array(fetched_at.isoformat())
         }
-        with open(FRED_CACHE_FILE, 'w') as f:
-            json.dump(cache_data, f)
-        logger.info("FRED cache saved successfully")
+        for column in FRED_COLUMNS:
+            arrays[column] = df[column].to_numpy(dtype=np.float64)
+        for column, observations in series.items():
+            arrays[f'{column}_dates'] = observations.index.values.astype('datetime64[ns]').astype(np.int64)
+            arrays[f'{column}_values'] = observations.to_numpy(dtype=np.float64)
+        save_npz_atomic(FRED_SNAPSHOT_FILE, **arrays)
+        logger.info("FRED snapshot saved successfully")
     except Exception as e:
-        logger.warning(f"Error saving FRED cache: {e}")
+        logger.warning(f"Error saving FRED snapshot: {e}")
 
-def _fetch_fresh_fred_data():
-    """Fetch fresh FRED data from API."""
-    try:
-        fred = Fred(api_key=FRED_API_KEY)
-        
-        end_date = datetime.now()
-        start_date = end_date - timedelta(days=180)
-        
-        logger.info("Fetching fresh FRED data from API...")
-        walcl = fred.get_series('WALCL', start_date, end_date)
-        tga = fred.get_series('WTREGEN', start_date, end_date)
-        rrp = fred.get_series('RRPONTSYD', start_date, end_date)
-        credit_spreads = fred.get_series('BAMLH0A0HYM2', start_date, end_date)
+def _encode_fred_series(observations):
+    return {
+        'dates': [d.strftime('%Y-%m-%d') for d in observations.index],
+        'values': [None if pd.isna(v) else float(v) for v in observations]
+    }
+
+def _decode_fred_series(recorded):
+    return pd.Series(recorded['values'], index=pd.to_datetime(recorded['dates']), dtype=float)
+
+def _get_fred_series(series_id, observation_start):
+    """
+    Observations of one FRED series from observation_start (YYYY-MM-DD), through
+    provider_replay. The fixture is keyed by the series alone; replay trims the
+    recorded observations to the requested start.
+    """
+    def live():
+        rate_limiter.acquire('fred')
+        return Fred(api_key=FRED_API_KEY).get_series(series_id, observation_start=observation_start)
+    
+    observations = provider_replay.through(
+        'fred', 'get_series', provider_replay.request_key(series_id), live,
+        encode=_encode_fred_series, decode=_decode_fred_series
+    )
+    if provider_replay.PROVIDER_MODE == 'replay':
+        observations = observations[observations.index >= pd.Timestamp(observation_start)]
+    return observations
+
+def _fetch_new_fred_observations(series):
+    """
+    Fetch only the observations after the last stored date of each series
+    (the full FRED_HISTORY_DAYS window for a series we do not hold yet).
+    Returns (updated series dict, earliest new observation date or None).
+    """
+    history_start = pd.Timestamp(datetime.now().date()) - timedelta(days=FRED_HISTORY_DAYS)
+    
+    updated = dict(series)
+    earliest_new = None
+    for column, series_id in FRED_SERIES.items():
+        existing = series.get(column)
+        if existing is not None and len(existing) > 0:
+            observation_start = existing.index[-1] + timedelta(days=1)
+        else:
+            observation_start = history_start
         
-        df = pd.DataFrame(index=pd.date_range(start_date, end_date, freq='D'))
-        df.index.name = 'date'
+        new = _get_fred_series(series_id, observation_start.strftime('%Y-%m-%d'))
+        new = new.dropna() if new is not None else None
+        if new is None or len(new) == 0:
+            continue
         
-        if walcl is not None and len(walcl) > 0:
-            df['walcl'] = walcl.reindex(df.index, method='ffill')
-        else:
-            df['walcl'] = 7000000
-            
-        if tga is not None and len(tga) > 0:
-            df['tga'] = tga.reindex(df.index, method='ffill')
+        logger.info(f"FRED {series_id}: {len(new)} new observations from {observation_start:%Y-%m-%d}")
+        if existing is not None and len(existing) > 0:
+            combined = pd.concat([existing, new])
+            updated[column] = combined[~combined.index.duplicated(keep='last')].sort_index()
         else:
-            df['tga'] = 800000
-            
-        if rrp is not None and len(rrp) > 0:
-            df['rrp'] = rrp.reindex(df.index, method='ffill')
+            updated[column] = new.sort_index()
+        if earliest_new is None or new.index[0] < earliest_new:
+            earliest_new = new.index[0]
+    
+    # Drop observations that left the window, keeping the last one before it to forward-fill from
+    for column, observations in updated.items():
+        if observations is not None and len(observations) > 0:
+            first = max(int(observations.index.searchsorted(history_start, side='right')) - 1, 0)
+            updated[column] = observations.iloc[first:]
+    return updated, earliest_new
+
+def _build_fred_rows(series, index):
+    """Forward-fill the raw observations onto a daily index."""
+    df = pd.DataFrame(index=index)
+    df.index.name = 'date'
+    for column in FRED_SERIES:
+        observations = series.get(column)
+        if observations is not None and len(observations) > 0:
+            df[column] = observations.reindex(index, method='ffill')
         else:
-            df['rrp'] = 500000
-            
-        if credit_spreads is not None and len(credit_spreads) > 0:
-            df['credit_spreads'] = credit_spreads.reindex(df.index, method='ffill')
+            df[column] = FRED_DEFAULTS[column]
+    df['net_liquidity'] = df['walcl'] - df['tga'] - df['rrp']
+    return df.dropna()
+
+def _refresh_fred_data(frame, series):
+    """
+    Bring the daily FRED frame up to date incrementally: fetch new observations,
+    then rebuild only the rows from the first new observation (or the day after
+    the last stored row) to today and append them to the rows we keep. Rows
+    older than FRED_HISTORY_DAYS are dropped.
+    """
+    try:
+        logger.info("Refreshing FRED data from API...")
+        series, earliest_new = _fetch_new_fred_observations(series)
+        
+        today = pd.Timestamp(datetime.now().date())
+        if frame is None or len(frame) == 0:
+            rebuild_from = today - timedelta(days=FRED_HISTORY_DAYS)
+            kept = None
         else:
-            df['credit_spreads'] = 3.5
+            rebuild_from = frame.index[-1].normalize() + timedelta(days=1)
+            if earliest_new is not None:
+                rebuild_from = min(rebuild_from, earliest_new.normalize())
+            kept = frame[frame.index < rebuild_from]
         
-        df['net_liquidity'] = df['walcl'] - df['tga'] - df['rrp']
-        df = df.dropna()
+        if rebuild_from > today:
+            return frame, series
         
-        return df
+        new_rows = _build_fred_rows(series, pd.date_range(rebuild_from, today, freq='D'))
+        df = new_rows if kept is None else pd.concat([kept, new_rows])
+        # Keep the frame (and its snapshot) to the FRED_HISTORY_DAYS window
+        df = df[df.index >= today - timedelta(days=FRED_HISTORY_DAYS)]
+        return df, series
     except Exception as e:
         logger.error(f"FRED API error: {e}")
-        return None
+        return None, series
 
 def get_fred_data():
-    """Get FRED macro data with 24-hour file-based caching."""
-    cached_df = _load_fred_cache()
-    if cached_df is not None:
-        return cached_df
+    """
+    Get FRED macro data, refreshed every 24 hours.
+    The decoded frame lives in memory; the binary snapshot is only read at process
+    start or once the in-memory copy is stale (another worker may have refreshed it).
+    A failed refresh keeps serving the current frame and is not retried for
+    FRED_RETRY_MINUTES, so an outage does not serialize every request on the lock.
+    """
+    global _fred_frame, _fred_series, _fred_timestamp, _fred_last_failure
     
-    fresh_df = _fetch_fresh_fred_data()
-    if fresh_df is not None:
-        _save_fred_cache(fresh_df)
+    if _fred_frame is not None and _fred_age_hours(_fred_timestamp) < FRED_CACHE_TTL_HOURS:
+        return _fred_frame
+    if _fred_backing_off():
+        return _fred_frame
     
-    return fresh_df
+    with _fred_lock:
+        if _fred_frame is not None and _fred_age_hours(_fred_timestamp) < FRED_CACHE_TTL_HOURS:
+            return _fred_frame
+        if _fred_backing_off():
+            return _fred_frame
+        
+        snapshot_df, snapshot_series, snapshot_time = _load_fred_snapshot()
+        if snapshot_df is not None and _fred_age_hours(snapshot_time) < FRED_CACHE_TTL_HOURS:
+            logger.info(f"FRED snapshot hit - age: {_fred_age_hours(snapshot_time):.1f} hours")
+            _fred_frame, _fred_series, _fred_timestamp = snapshot_df, snapshot_series, snapshot_time
+            return _fred_frame
+        
+        # Continue from whichever copy is newer: ours or the snapshot another worker wrote
+        if snapshot_df is not None and (_fred_timestamp is None or snapshot_time > _fred_timestamp):
+            base_frame, base_series = snapshot_df, snapshot_series
+        else:
+            base_frame, base_series = _fred_frame, _fred_series
+        if not base_series:
+            # Snapshots without raw observations cannot be extended
+            base_frame = None
+        
+        fresh_df, fresh_series = _refresh_fred_data(base_frame, base_series)
+        if fresh_df is not None and len(fresh_df) > 0:
+            fetched_at = datetime.now()
+            _save_fred_snapshot(fresh_df, fresh_series, fetched_at)
+            _fred_frame, _fred_series, _fred_timestamp = fresh_df, fresh_series, fetched_at
+            _fred_last_failure = None
+            return _fred_frame
+        
+        logger.warning(f"FRED refresh failed; not retrying for {FRED_RETRY_MINUTES} minutes")
+        _fred_last_failure = datetime.now()
+        # Serve stale data rather than nothing while FRED is unreachable
+        if _fred_frame is None and snapshot_df is not None:
+            _fred_frame, _fred_series, _fred_timestamp = snapshot_df, snapshot_series, snapshot_time
+        return _fred_frame
 
 def get_spy_data():
-    """Get SPY historical data using MarketData.app candles."""
-    key = "spy_data"
-    def fetch():
-        try:
-            df = marketdata_service.get_historical_candles('SPY', days=180)
-            if df is not None and len(df) > 0:
-                df = df.set_index('date')
-                return df
-        except Exception as e:
-            logger.error(f"Error fetching SPY data: {e}")
-        return None
-    return get_cached(key, fetch)
+    """Get SPY historical data, sliced from the shared SPY candle window when one is cached."""
+    try:
+        df = get_historical_prices('SPY', days=180)
+        if df is not None and len(df) > 0:
+            return df.set_index('date')
+    except Exception as e:
+        logger.error(f"Error fetching SPY data: {e}")
+    return None
@@ -0,0 +1,59 @@
+import hashlib
+import logging
+import numpy as np
+
+import indicator_state
+from scoring_engine import calculate_rsi_series, calculate_macd_series
+from technicals_batch import PANEL_COLUMNS
+from services.caching import SingleFlight, create_cache_backend, fetch_through
+
+logger = logging.getLogger(__name__)
+
+# Keyed by candle version, so an entry never goes stale; the TTL only ages out unused symbols
+cache = create_cache_backend('indicators', ttl=24 * 3600)
+flight = SingleFlight('indicators')
+
+
+def candle_version(hist_df):
+    """Content hash of a candle DataFrame: any new, revised or restated bar gives a new version."""
+    digest = hashlib.sha1(hist_df['date'].values.astype('datetime64[s]').tobytes())
+    for column in PANEL_COLUMNS:
+        if column in hist_df.columns:
+            digest.update(column.encode('utf-8'))
+            digest.update(hist_df[column].to_numpy(dtype=np.float64).tobytes())
+    return digest.hexdigest()[:20]
+
+
+def compute_series(hist_df):
+    """Per-bar chart indicators as float arrays aligned with hist_df (NaN where undefined)."""
+    close_prices = hist_df['close']
+    macd_series, signal_series = calculate_macd_series(close_prices)
+    series = {
+        'rsi': calculate_rsi_series(close_prices, period=14),
+        'macd': macd_series,
+        'macd_signal': signal_series,
+        'histogram': macd_series - signal_series,
+        'sma_50': close_prices.rolling(window=50).mean(),
+        'sma_200': close_prices.rolling(window=200).mean()
+    }
+    if 'volume' in hist_df.columns:
+        series['volume_sma'] = hist_df['volume'].rolling(20).mean()
+    return {name: values.to_numpy(dtype=np.float64) for name, values in series.items()}
+
+
+def get_bundle(ticker, hist_df):
+    """
+    Technicals for one (symbol, candle version), computed once and cached:
+    'technicals' is the (score, details) pillar result and 'series' the per-bar
+    chart indicators. Scoring and the price history payload both read it, and
+    repeat requests for unchanged candles do no indicator work at all.
+    """
+    ticker = ticker.upper()
+    key = f"bundle_{ticker}_{candle_version(hist_df)}"
+
+    def compute():
+        return {
+            'technicals': indicator_state.score_technicals_incremental(ticker, hist_df),
+            'series': compute_series(hist_df)
+        }
+    return fetch_through(cache, flight, key, compute)
@@ -0,0 +1,476 @@
+import os
+import copy
+import math
+import threading
+import logging
+from collections import deque
+import numpy as np
+import pandas as pd
+
+from scoring_engine import score_technicals
+from technicals_batch import (
+    MIN_HISTORY, RSI_PERIOD, DIVERGENCE_LOOKBACK, PANEL_COLUMNS, INSUFFICIENT_DATA,
+    detect_divergence, technicals_from_values
+)
+from services.snapshots import save_npz_atomic, load_npz, is_valid_symbol, symbol_path
+
+logger = logging.getLogger(__name__)
+
+INDICATOR_STATE_DIR = os.environ.get(
+    'INDICATOR_STATE_DIR',
+    os.path.join(os.path.dirname(__file__), 'data', 'indicators')
+)
+# Bump when the snapshot layout changes; older snapshots are then rebuilt from history
+STATE_VERSION = 1
+VOLUME_SMA_PERIOD = 20
+ATR_PERIOD = 14
+LOWEST_LOW_PERIOD = 20
+
+# symbol -> IndicatorState, shared by every request in this process
+_states = {}
+_stats = {'rebuilds': 0, 'advanced_bars': 0, 'updates': 0}
+_lock = threading.Lock()
+
+
+class Ema:
+    """
+    Running pandas ewm(adjust=False).mean(): the same float operations in the
+    same order, so the value after each bar is identical to the pandas series.
+    """
+
+    def __init__(self, com, min_periods):
+        self.alpha = 1. / (1. + com)
+        self.min_periods = min_periods
+        self.weighted = math.nan
+        self.old_wt = 1.
+        self.nobs = 0
+
+    def update(self, value):
+        observed = value == value
+        self.nobs += observed
+        if self.weighted == self.weighted:
+            self.old_wt *= 1. - self.alpha
+            if observed:
+                if self.weighted != value:
+                    self.weighted = (self.old_wt * self.weighted + self.alpha * value) / (self.old_wt + self.alpha)
+                self.old_wt = 1.
+        elif observed:
+            self.weighted = value
+
+    @property
+    def value(self):
+        return self.weighted if self.nobs >= self.min_periods else math.nan
+
+    def copy(self):
+        return copy.copy(self)
+
+    def to_array(self):
+        return np.array([self.weighted, self.old_wt, self.nobs], dtype=np.float64)
+
+    def load(self, array):
+        self.weighted, self.old_wt, self.nobs = float(array[0]), float(array[1]), int(array[2])
+
+
+class RollingMean:
+    """
+    Running pandas rolling(window).mean(): a Kahan-compensated window sum that
+    adds the new value and subtracts the one leaving the window, as pandas does.
+    """
+
+    def __init__(self, window):
+        self.window = window
+        self.values = deque(maxlen=window)
+        self.sum = 0.
+        self.add_compensation = 0.
+        self.remove_compensation = 0.
+        self.nobs = 0
+        self.neg_ct = 0
+        self.same_count = 0
+        self.prev_value = None
+
+    def _add(self, value):
+        if value != value:
+            return
+        self.nobs += 1
+        y = value - self.add_compensation
+        t = self.sum + y
+        self.add_compensation = t - self.sum - y
+        self.sum = t
+        self.neg_ct += math.copysign(1., value) < 0
+        self.same_count = self.same_count + 1 if value == self.prev_value else 1
+        self.prev_value = value
+
+    def _remove(self, value):
+        if value != value:
+            return
+        self.nobs -= 1
+        y = -value - self.remove_compensation
+        t = self.sum + y
+        self.remove_compensation = t - self.sum - y
+        self.sum = t
+        self.neg_ct -= math.copysign(1., value) < 0
+
+    def update(self, value):
+        if self.prev_value is None:
+            self.prev_value = value
+        if len(self.values) == self.window:
+            self._remove(self.values[0])
+        self.values.append(value)
+        self._add(value)
+
+    @property
+    def value(self):
+        if self.nobs < self.window:
+            return math.nan
+        if self.same_count >= self.nobs:
+            return self.prev_value
+        result = self.sum / self.nobs
+        if self.neg_ct == 0 and result < 0:
+            return 0.
+        if self.neg_ct == self.nobs and result > 0:
+            return 0.
+        return result
+
+    def copy(self):
+        clone = copy.copy(self)
+        clone.values = self.values.copy()
+        return clone
+
+    def to_array(self):
+        prev_value = math.nan if self.prev_value is None else self.prev_value
+        return np.array([
+            self.sum, self.add_compensation, self.remove_compensation,
+            self.nobs, self.neg_ct, self.same_count, prev_value, self.prev_value is None
+        ], dtype=np.float64)
+
+    def load(self, array, values):
+        self.sum, self.add_compensation, self.remove_compensation = (float(v) for v in array[:3])
+        self.nobs, self.neg_ct, self.same_count = (int(v) for v in array[3:6])
+        self.prev_value = None if array[7] else float(array[6])
+        self.values = deque((float(v) for v in values), maxlen=self.window)
+
+
+def _rsi(avg_gain, avg_loss):
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return float(100 - (100 / (1 + np.float64(avg_gain) / avg_loss)))
+
+
+def _true_range(high, low, previous_close):
+    ranges = [r for r in (high - low, abs(high - previous_close), abs(low - previous_close)) if r == r]
+    return max(ranges) if ranges else math.nan
+
+
+class IndicatorState:
+    """
+    One symbol's technicals indicators as of its last settled bar: EMA
+    accumulators for RSI and MACD, rolling window sums for the volume SMA and
+    ATR, and the last few closes, RSI values and lows for divergence and
+    support. Settling a bar and evaluating a provisional (intraday) bar on top
+    of the settled state both cost O(1), independent of history length.
+    """
+
+    def __init__(self):
+        self.last_bar = None
+        self.bars = 0
+        self.gain = Ema((1 - 1 / RSI_PERIOD) / (1 / RSI_PERIOD), RSI_PERIOD)
+        self.loss = Ema((1 - 1 / RSI_PERIOD) / (1 / RSI_PERIOD), RSI_PERIOD)
+        self.ema_fast = Ema((12 - 1) / 2, 12)
+        self.ema_slow = Ema((26 - 1) / 2, 26)
+        self.signal = Ema((9 - 1) / 2, 9)
+        self.macd_line = math.nan
+        self.signal_line = math.nan
+        self.volume_sma = RollingMean(VOLUME_SMA_PERIOD)
+        self.atr = RollingMean(ATR_PERIOD)
+        self.closes = deque(maxlen=DIVERGENCE_LOOKBACK)
+        self.rsis = deque(maxlen=DIVERGENCE_LOOKBACK)
+        self.lows = deque(maxlen=LOWEST_LOW_PERIOD)
+
+    def _accumulators(self):
+        return {
+            'gain': self.gain, 'loss': self.loss,
+            'ema_fast': self.ema_fast, 'ema_slow': self.ema_slow, 'signal': self.signal
+        }
+
+    def _step(self, bar):
+        """Feed one (date, open, high, low, close, volume) bar to every accumulator."""
+        _, _, high, low, close, volume = bar
+        previous_close = self.last_bar[4] if self.last_bar is not None else math.nan
+
+        delta = close - previous_close
+        self.gain.update(delta if delta > 0 else 0.)
+        self.loss.update(-delta if delta < 0 else 0.)
+        rsi = _rsi(self.gain.value, self.loss.value)
+
+        self.ema_fast.update(close)
+        self.ema_slow.update(close)
+        macd_line = self.ema_fast.value - self.ema_slow.value
+        self.signal.update(macd_line)
+
+        self.volume_sma.update(volume)
+        self.atr.update(_true_range(high, low, previous_close))
+
+        self.closes.append(close)
+        self.rsis.append(rsi)
+        self.lows.append(low)
+        self.macd_line, self.signal_line = macd_line, self.signal.value
+        self.last_bar = bar
+        self.bars += 1
+
+    def copy(self):
+        clone = copy.copy(self)
+        for name in ('gain', 'loss', 'ema_fast', 'ema_slow', 'signal', 'volume_sma', 'atr', 'closes', 'rsis', 'lows'):
+            setattr(clone, name, getattr(self, name).copy())
+        return clone
+
+    def advance(self, bar):
+        """Settle one more bar."""
+        self._step(bar)
+
+    def evaluate(self, bar):
+        """Indicator values with `bar` as the provisional last bar; the settled state is not modified."""
+        state = self.copy()
+        state._step(bar)
+        _, open_, _, _, close, volume = bar
+
+        diff_today = state.macd_line - state.signal_line
+        diff_yesterday = self.macd_line - self.signal_line
+        divergence = detect_divergence(np.array(state.closes)[:, None], np.array(state.rsis)[:, None])[0]
+        return {
+            'current_price': close,
+            'current_open': open_,
+            'current_volume': volume,
+            'rsi': state.rsis[-1],
+            'divergence': divergence,
+            'macd': state.macd_line,
+            'macd_signal': state.signal_line,
+            'golden_cross': diff_today > 0 and diff_yesterday <= 0,
+            'death_cross': diff_today < 0 and diff_yesterday >= 0,
+            'sma_volume_20': state.volume_sma.value,
+            'atr_14': state.atr.value,
+            'lowest_low_20': np.fmin.reduce(np.array(state.lows))
+        }
+
+    def catch_up(self, bars):
+        """
+        Settle every bar of `bars` after the last settled one, except the final
+        (provisional) bar. Returns the number of bars settled, or None when the
+        history no longer contains our last settled bar unchanged, i.e. it was
+        corrected and the state has to be rebuilt.
+        """
+        dates = bars.dates
+        position = int(np.searchsorted(dates, self.last_bar[0]))
+        if position > len(dates) - 2 or dates[position] != self.last_bar[0]:
+            return None
+        if not np.array_equal(bars.row(position), self.last_bar, equal_nan=True):
+            return None
+        for i in range(position + 1, len(dates) - 1):
+            self.advance(bars.row(i))
+        return len(dates) - 2 - position
+
+    @classmethod
+    def from_history(cls, bars):
+        """Full recompute: settle every bar but the last."""
+        state = cls()
+        for i in range(len(bars.dates) - 1):
+            state.advance(bars.row(i))
+        return state
+
+    def to_arrays(self):
+        arrays = {name: accumulator.to_array() for name, accumulator in self._accumulators().items()}
+        arrays.update({
+            'version': np.array(STATE_VERSION),
+            'bars': np.array(self.bars),
+            'last_bar': np.array(self.last_bar, dtype=np.float64),
+            'macd': np.array([self.macd_line, self.signal_line]),
+            'volume_sma': self.volume_sma.to_array(),
+            'volume_window': np.array(self.volume_sma.values, dtype=np.float64),
+            'atr': self.atr.to_array(),
+            'atr_window': np.array(self.atr.values, dtype=np.float64),
+            'closes': np.array(self.closes, dtype=np.float64),
+            'rsis': np.array(self.rsis, dtype=np.float64),
+            'lows': np.array(self.lows, dtype=np.float64)
+        })
+        return arrays
+
+    @classmethod
+    def from_arrays(cls, arrays):
+        state = cls()
+        for name, accumulator in state._accumulators().items():
+            accumulator.load(arrays[name])
+        last_bar = arrays['last_bar'].tolist()
+        state.last_bar = (int(last_bar[0]),) + tuple(last_bar[1:])
+        state.bars = int(arrays['bars'])
+        state.macd_line, state.signal_line = (float(v) for v in arrays['macd'])
+        state.volume_sma.load(arrays['volume_sma'], arrays['volume_window'])
+        state.atr.load(arrays['atr'], arrays['atr_window'])
+        state.closes.extend(arrays['closes'].tolist())
+        state.rsis.extend(arrays['rsis'].tolist())
+        state.lows.extend(arrays['lows'].tolist())
+        return state
+
+
+class Bars:
+    """Column arrays of a candle DataFrame, read row by row as state bars."""
+
+    def __init__(self, hist_df):
+        self.dates = hist_df['date'].values.astype('datetime64[s]').astype(np.int64)
+        self.values = hist_df[list(PANEL_COLUMNS)].to_numpy(dtype=np.float64)
+
+    def row(self, i):
+        return (int(self.dates[i]),) + tuple(self.values[i].tolist())
+
+
+def _state_path(ticker):
+    return symbol_path(INDICATOR_STATE_DIR, ticker)
+
+
+def _load_state(ticker):
+    try:
+        arrays = load_npz(_state_path(ticker))
+        if arrays is None or int(arrays['version']) != STATE_VERSION:
+            return None
+        return IndicatorState.from_arrays(arrays)
+    except Exception as e:
+        logger.warning(f"Unreadable indicator state for {ticker}: {e}")
+    return None
+
+
+def _save_state(ticker, arrays):
+    try:
+        save_npz_atomic(_state_path(ticker), **arrays)
+    except Exception as e:
+        logger.warning(f"Could not persist indicator state for {ticker}: {e}")
+
+
+def invalidate(ticker):
+    """Drop a symbol's state after its history was corrected; the next evaluation rebuilds it."""
+    ticker = ticker.upper()
+    with _lock:
+        _states.pop(ticker, None)
+        if not is_valid_symbol(ticker):
+            return
+        try:
+            os.remove(_state_path(ticker))
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logger.warning(f"Could not remove indicator state for {ticker}: {e}")
+
+
+def get_indicators(ticker, hist_df):
+    """
+    Last-bar technicals indicator values for `hist_df` (a candle DataFrame with
+    date and OHLCV columns, at least two bars), served from the symbol's running
+    state. Bars that settled since the last call are folded in one at a time and
+    the final bar is evaluated provisionally, so a refreshed intraday bar never
+    touches the settled state; the full history is only replayed when the state
+    is missing or the history was corrected.
+    """
+    ticker = ticker.upper()
+    bars = Bars(hist_df)
+    rebuilt = False
+
+    with _lock:
+        state = _states.get(ticker) or _load_state(ticker)
+        settled = state.catch_up(bars) if state is not None else None
+
+    if settled is None:
+        state = IndicatorState.from_history(bars)
+        settled = state.bars
+        rebuilt = True
+        logger.info(f"Indicator state: rebuilt {ticker} from {state.bars} bars")
+
+    with _lock:
+        _states[ticker] = state
+        values = state.evaluate(bars.row(len(bars.dates) - 1))
+        arrays = state.to_arrays() if settled else None
+        _stats['rebuilds'] += rebuilt
+        _stats['advanced_bars'] += 0 if rebuilt else settled
+        _stats['updates'] += 1
+
+    if arrays is not None:
+        _save_state(ticker, arrays)
+    return values
+
+
+def score_technicals_incremental(ticker, hist_df):
+    """
+    score_technicals for one symbol, computed from its running indicator state
+    instead of over the whole history. Frames without date and OHLCV columns,
+    and symbols that are not plain tickers, take the full per-call path.
+    """
+    if hist_df is None or len(hist_df) < MIN_HISTORY:
+        return 5.0, dict(INSUFFICIENT_DATA)
+    # Symbols that cannot name a state file take the full per-call path too
+    if not is_valid_symbol(ticker.upper()) or not all(column in hist_df.columns for column in ('date',) + PANEL_COLUMNS):
+        return score_technicals(hist_df)
+    return technicals_from_values(get_indicators(ticker, hist_df))
+
+
+def stats():
+    return dict(_stats, symbols=len(_states), path=INDICATOR_STATE_DIR)
+
+
+def _synthetic_candles(rng, bars, flat=False):
+    close = np.round(100 * np.exp(np.cumsum(rng.normal(0, 0.02, bars))), 2)
+    if flat:
+        # A run with no gains or losses (RSI's zero-loss edge case)
+        close[:bars // 2] = 50.0
+    open_ = np.round(close * (1 + rng.normal(0, 0.005, bars)), 2)
+    spread = np.round(np.abs(rng.normal(0, 0.5, (2, bars))), 2)
+    return pd.DataFrame({
+        'date': pd.bdate_range('2022-01-03', periods=bars),
+        'open': open_,
+        'high': np.maximum(open_, close) + spread[0],
+        'low': np.minimum(open_, close) - spread[1],
+        'close': close,
+        'volume': rng.integers(100_000, 10_000_000, bars).astype(np.float64)
+    })
+
+
+def _self_check(seed=1):
+    """
+    Compare score_technicals_incremental with score_technicals: cold builds,
+    day-by-day growth with intraday revisions of the last bar, catching up
+    several bars at once, a reload from disk and a restated bar. Uses a
+    temporary state dir.
+    """
+    global INDICATOR_STATE_DIR
+    import tempfile
+    rng = np.random.default_rng(seed)
+    mismatches = checks = 0
+
+    def check(ticker, df, label):
+        nonlocal mismatches, checks
+        checks += 1
+        if score_technicals_incremental(ticker, df) != score_technicals(df):
+            mismatches += 1
+            print(f"mismatch: {label} {ticker} at {len(df)} bars")
+
+    with tempfile.TemporaryDirectory() as directory:
+        INDICATOR_STATE_DIR = directory
+        for k in range(100):
+            check(f"T{k}", _synthetic_candles(rng, int(rng.integers(MIN_HISTORY, 600)), flat=k % 10 == 0), 'cold')
+        for k in range(5):
+            ticker, df = f"G{k}", _synthetic_candles(rng, 400, flat=k == 0)
+            for bars in range(250, 380):
+                revised = df.iloc[:bars].copy()
+                revised.loc[bars - 1, 'close'] = round(revised.loc[bars - 1, 'close'] * 1.01, 2)
+                check(ticker, revised, 'intraday')
+                check(ticker, df.iloc[:bars], 'growth')
+            check(ticker, df, 'catch-up')
+            _states.clear()
+            check(ticker, df, 'reload')
+            restated = df.copy()
+            restated.loc[390, 'close'] *= 1.5
+            # The candle store invalidates the state when it sees restated bars
+            invalidate(ticker)
+            check(ticker, restated, 'restated')
+        _states.clear()
+    print(f"indicator state: {checks} checks, {mismatches} mismatches, {stats()}")
+    return mismatches == 0
+
+
+if __name__ == '__main__':
+    # cd backend && python -m indicator_state
+    raise SystemExit(0 if _self_check() else 1)
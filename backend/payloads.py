@@ -0,0 +1,168 @@
+import hashlib
+import logging
+import numpy as np
+import pandas as pd
+from datetime import datetime, timedelta
+
+logger = logging.getLogger(__name__)
+
+PRICE_HISTORY_DAYS = 365
+# The chart normalizes both series to the start of this window
+NET_LIQUIDITY_WINDOW_DAYS = 180
+NET_LIQUIDITY_POINTS = 90
+
+_UNDEFINED = object()
+
+# Net-liquidity chart with the FRED frame, SPY candle version and day it was built from
+_net_liquidity = None
+
+
+def round_values(values, decimals):
+    """
+    Vectorized round() with identical results: np.round can differ from
+    Python's correctly rounded round() only next to a tie, so those few
+    values are rounded one by one.
+    """
+    rounded = np.round(values, decimals)
+    with np.errstate(invalid='ignore'):
+        scaled = values * 10 ** decimals
+        near_tie = np.abs(scaled - np.floor(scaled) - 0.5) < 1e-6
+    for i in np.flatnonzero(near_tie):
+        rounded[i] = round(float(values[i]), decimals)
+    return rounded
+
+
+def date_labels(dates):
+    """'YYYY-MM-DD' strings for a Series or Index of dates."""
+    if pd.api.types.is_datetime64_any_dtype(dates):
+        dates = pd.DatetimeIndex(dates)
+        if dates.tz is not None:
+            dates = dates.tz_localize(None)
+        return np.datetime_as_string(dates.values, unit='D').tolist()
+    return [str(date)[:10] for date in dates]
+
+
+def _optional(values, converted):
+    """Converted values, with the marker that drops the key wherever `values` is NaN."""
+    return np.where(np.isnan(values), _UNDEFINED, converted.astype(object)).tolist()
+
+
+def _entries(fields):
+    names = list(fields)
+    return [
+        {name: value for name, value in zip(names, values) if value is not _UNDEFINED}
+        for values in zip(*fields.values())
+    ]
+
+
+def build_price_history(hist_df, series):
+    """
+    The chart payload for the last PRICE_HISTORY_DAYS bars, built column-wise
+    from hist_df and the indicator bundle series: one dict per bar, with an
+    indicator key left out wherever that indicator is undefined (NaN).
+    """
+    window = hist_df.iloc[-PRICE_HISTORY_DAYS:]
+    start = len(hist_df) - len(window)
+
+    def column(name, decimals):
+        if name not in window.columns:
+            return [None] * len(window)
+        return round_values(window[name].to_numpy(dtype=np.float64), decimals).tolist()
+
+    def indicator(name, decimals=None):
+        values = series[name][start:]
+        if decimals is None:
+            return _optional(values, np.where(np.isnan(values), 0, values).astype(np.int64))
+        return _optional(values, round_values(values, decimals))
+
+    fields = {
+        'date': date_labels(window['date']),
+        'price': column('close', 2),
+        'open': column('open', 2),
+        'high': column('high', 2),
+        'low': column('low', 2),
+        'rsi': indicator('rsi', 2),
+        'macd': indicator('macd', 4),
+        'macd_signal': indicator('macd_signal', 4),
+        'histogram': indicator('histogram', 4)
+    }
+    if 'volume' in window.columns:
+        fields['volume'] = window['volume'].to_numpy().astype(np.int64).tolist()
+        if 'volume_sma' in series:
+            fields['volume_sma'] = indicator('volume_sma')
+    fields['sma_50'] = indicator('sma_50', 2)
+    fields['sma_200'] = indicator('sma_200', 2)
+    return _entries(fields)
+
+
+def build_net_liquidity(fred_df, spy_df, today):
+    """
+    The net-liquidity chart over the NET_LIQUIDITY_WINDOW_DAYS before `today`:
+    net liquidity and SPY, each also normalized to 100 at the start of the
+    window. Returns the full window of entries plus the latest readings.
+    """
+    fred_df = fred_df.copy()
+    fred_df.index = pd.to_datetime(fred_df.index).tz_localize(None).normalize()
+    window_start = pd.Timestamp(today) - timedelta(days=NET_LIQUIDITY_WINDOW_DAYS)
+    fred_df = fred_df[fred_df.index >= window_start]
+
+    spy_close = None
+    if spy_df is not None:
+        spy_df = spy_df.copy()
+        spy_df.index = pd.to_datetime(spy_df.index).tz_localize(None).normalize()
+        spy_df = spy_df[~spy_df.index.duplicated(keep='first')]
+        spy_close = spy_df['close'].reindex(fred_df.index, method='ffill')
+        fred_df = fred_df.assign(spy_close=spy_close)
+
+    fred_df = fred_df.dropna(subset=['net_liquidity'])
+    net_liquidity = fred_df['net_liquidity'].to_numpy(dtype=np.float64)
+
+    fields = {
+        'date': date_labels(fred_df.index),
+        'net_liquidity': round_values(net_liquidity / 1000000, 2).tolist()
+    }
+    if len(fred_df) > 0:
+        fields['net_liquidity_norm'] = round_values((net_liquidity / net_liquidity[0]) * 100, 2).tolist()
+
+        if spy_close is not None:
+            spy_close = fred_df['spy_close'].to_numpy(dtype=np.float64)
+            fields['spy_price'] = _optional(spy_close, round_values(spy_close, 2))
+            priced = spy_close[~np.isnan(spy_close)]
+            if len(priced) > 0:
+                spy_norm = (spy_close / priced[0]) * 100
+                fields['spy_norm'] = _optional(spy_norm, round_values(spy_norm, 2))
+
+    return {
+        'data': _entries(fields),
+        'current_net_liquidity': round(float(fred_df['net_liquidity'].iloc[-1]) / 1000000, 2),
+        'credit_spread': round(float(fred_df['credit_spreads'].iloc[-1]), 2)
+    }
+
+
+def _spy_version(spy_df):
+    if spy_df is None:
+        return None
+    digest = hashlib.sha1(spy_df.index.values.tobytes())
+    digest.update(spy_df['close'].to_numpy(dtype=np.float64).tobytes())
+    return digest.hexdigest()
+
+
+def get_net_liquidity(fred_df, spy_df):
+    """
+    The /api/macro/net-liquidity response. The chart is rebuilt only when the
+    FRED frame is refreshed, the SPY candles change or the day rolls over;
+    every other request just slices the last NET_LIQUIDITY_POINTS entries.
+    """
+    global _net_liquidity
+
+    key = (_spy_version(spy_df), datetime.now().date())
+    cached = _net_liquidity
+    if cached is None or cached['fred'] is not fred_df or cached['key'] != key:
+        payload = build_net_liquidity(fred_df, spy_df, key[1])
+        logger.info(f"Net liquidity chart rebuilt: {len(payload['data'])} points")
+        # Concurrent rebuilds produce the same chart, so the last one simply wins
+        cached = {'fred': fred_df, 'key': key, 'payload': payload}
+        _net_liquidity = cached
+
+    payload = cached['payload']
+    return dict(payload, data=payload['data'][-NET_LIQUIDITY_POINTS:])
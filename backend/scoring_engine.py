@@ -1,11 +1,13 @@
 import pandas as pd
 import numpy as np
 from datetime import datetime, timedelta
-from scipy.signal import argrelextrema
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Macro pillar result with the FRED frame it was scored from
+_macro = None
+
 def calculate_macd_series(prices, fast=12, slow=26, signal=9):
     """Calculate standard MACD (Moving Average Convergence Divergence)
     
@@ -39,6 +41,42 @@ def calculate_rsi(prices, period=14):
     rsi = calculate_rsi_series(prices, period)
     return rsi.iloc[-1] if not rsi.empty else 50
 
+def _sliding_extreme(values, order, reduce):
+    """
+    np.minimum/np.maximum over the window [i - order, i + order] along axis 0,
+    clipped at both ends, in O(n) regardless of order (van Herk/Gil-Werman:
+    prefix and suffix extremes within blocks of the window length). NaN in a
+    window propagates to its result.
+    """
+    length = values.shape[0]
+    width = 2 * order + 1
+    identity = np.inf if reduce is np.minimum else -np.inf
+    blocks = -(-(length + 2 * order) // width)
+    padded = np.full((blocks * width,) + values.shape[1:], identity)
+    padded[order:order + length] = values
+    shaped = padded.reshape((blocks, width) + values.shape[1:])
+    prefix = reduce.accumulate(shaped, axis=1).reshape(padded.shape)
+    suffix = reduce.accumulate(shaped[:, ::-1], axis=1)[:, ::-1].reshape(padded.shape)
+    return reduce(suffix[:length], prefix[width - 1:width - 1 + length])
+
+def relative_extrema_mask(values, comparator, order=1):
+    """
+    Boolean mask of relative extrema along axis 0 of a 1D series or a 2D
+    (bars x symbols) batch: the same points as scipy's
+    argrelextrema(values, comparator, order=order, mode='clip') for
+    comparator np.less_equal (minima) or np.greater_equal (maxima).
+    """
+    if comparator is np.less_equal:
+        reduce = np.minimum
+    elif comparator is np.greater_equal:
+        reduce = np.maximum
+    else:
+        raise ValueError('comparator must be np.less_equal or np.greater_equal')
+    if order < 1:
+        raise ValueError('order must be an int >= 1')
+    values = np.asarray(values, dtype=np.float64)
+    return values == _sliding_extreme(values, order, reduce)
+
 def detect_rsi_divergence(prices, rsi_series, lookback=30, order=5):
     if len(prices) < lookback or len(rsi_series) < lookback:
         return None, {}
@@ -50,10 +88,10 @@ def detect_rsi_divergence(prices, rsi_series, lookback=30, order=5):
         return None, {}
     
     try:
-        price_lows_idx = argrelextrema(recent_prices, np.less_equal, order=order)[0]
-        price_highs_idx = argrelextrema(recent_prices, np.greater_equal, order=order)[0]
-        rsi_lows_idx = argrelextrema(recent_rsi, np.less_equal, order=order)[0]
-        rsi_highs_idx = argrelextrema(recent_rsi, np.greater_equal, order=order)[0]
+        price_lows_idx = np.flatnonzero(relative_extrema_mask(recent_prices, np.less_equal, order=order))
+        price_highs_idx = np.flatnonzero(relative_extrema_mask(recent_prices, np.greater_equal, order=order))
+        rsi_lows_idx = np.flatnonzero(relative_extrema_mask(recent_rsi, np.less_equal, order=order))
+        rsi_highs_idx = np.flatnonzero(relative_extrema_mask(recent_rsi, np.greater_equal, order=order))
         
         if len(price_lows_idx) >= 2 and len(rsi_lows_idx) >= 2:
             last_price_low_idx = price_lows_idx[-1]
@@ -360,6 +398,18 @@ def score_value(price_targets, key_metrics, current_price, week52_high=None):
     score = max(0, min(10, score))
     return round(score, 1), details
 
+def rolling_slope(values, window):
+    """
+    Least-squares slope of every `window`-long run of `values` against
+    0..window-1 (the np.polyfit(x, y, 1) slope), aligned to the run's last
+    element. Closed form: sum((x - mean x) * y) / sum((x - mean x) ** 2).
+    Returns len(values) - window + 1 slopes.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    centered = np.arange(window) - (window - 1) / 2
+    runs = np.lib.stride_tricks.sliding_window_view(values, window)
+    return runs @ centered / (centered @ centered)
+
 def score_macro(fred_df):
     """
     3-Tier Traffic Light Macro Scoring System
@@ -390,9 +440,7 @@ def score_macro(fred_df):
     LIQUIDITY_THRESHOLD = 1000.0
     
     if len(recent_liq) >= 2:
-        x = np.arange(len(recent_liq))
-        liq_slope, _ = np.polyfit(x, recent_liq.values, 1)
-        liq_slope = float(liq_slope)
+        liq_slope = float(rolling_slope(recent_liq.values, len(recent_liq))[-1])
         details['net_liquidity_slope'] = round(liq_slope, 2)
         details['net_liquidity_current'] = round(float(fred_df['net_liquidity'].iloc[-1]), 2)
         
@@ -420,9 +468,7 @@ def score_macro(fred_df):
     credit_recent = fred_df['credit_spreads'].tail(10)
     credit_slope = 0.0
     if len(credit_recent) >= 2:
-        x = np.arange(len(credit_recent))
-        credit_slope, _ = np.polyfit(x, credit_recent.values, 1)
-        credit_slope = float(credit_slope)
+        credit_slope = float(rolling_slope(credit_recent.values, len(credit_recent))[-1])
         details['credit_spread_slope'] = round(credit_slope, 4)
         details['credit_spread_trend'] = 'Rising' if credit_slope > 0 else 'Falling'
     else:
@@ -455,6 +501,43 @@ def score_macro(fred_df):
     score = max(0, min(10, score))
     return round(score, 1), details
 
+def macro_score_history(fred_df):
+    """
+    The macro score as of every row of fred_df, vectorized with rolling_slope:
+    scores[i] equals score_macro(fred_df.iloc[:i + 1])[0] (5.0 until there
+    are 20 rows of data).
+    """
+    scores = np.full(len(fred_df) if fred_df is not None else 0, 5.0)
+    if fred_df is None or len(fred_df) < 20:
+        return scores
+    
+    liq_slope = rolling_slope(fred_df['net_liquidity'].values, 20)
+    credit_spread = fred_df['credit_spreads'].to_numpy(dtype=np.float64)[19:]
+    credit_slope = rolling_slope(fred_df['credit_spreads'].values, 10)[10:]
+    
+    with np.errstate(invalid='ignore'):
+        score = 5.0 + np.where(liq_slope > 1000.0, 2.5, np.where(liq_slope < -1000.0, -2.0, 0.0))
+        score += np.where(credit_spread < 3.50, 1.5, np.where(credit_spread > 4.50, -2.5, 0.0))
+        score -= np.where(credit_slope > 0.02, 1.5, 0.0)
+    scores[19:] = np.round(np.clip(score, 0, 10), 1)
+    return scores
+
+def get_macro_score(fred_df):
+    """
+    score_macro memoized on the FRED frame. data_services hands every request
+    the same frame until new FRED data arrives, so the pillar is scored once
+    per FRED version and shared by every analysis and scan.
+    """
+    global _macro
+    
+    cached = _macro
+    if cached is None or cached['fred'] is not fred_df:
+        # Concurrent rescoring gives the same result, so the last one simply wins
+        cached = {'fred': fred_df, 'result': score_macro(fred_df)}
+        _macro = cached
+    score, details = cached['result']
+    return score, dict(details)
+
 def check_earnings_blackout(earnings_calendar):
     """
     Check if we're in an earnings blackout window.
@@ -541,23 +624,27 @@ def score_event_risk(earnings_calendar):
     score = max(0, min(10, score))
     return round(score, 1), details
 
-def calculate_final_score(catalysts, technicals, value, macro, event_risk):
-    weights = {
-        'technicals': 0.40,
-        'catalysts': 0.10,
-        'macro': 0.25,
-        'value': 0.15,
-        'event_risk': 0.10
-    }
-    
-    final_score = (
+FINAL_SCORE_WEIGHTS = {
+    'technicals': 0.40,
+    'catalysts': 0.10,
+    'macro': 0.25,
+    'value': 0.15,
+    'event_risk': 0.10
+}
+
+def weighted_score(catalysts, technicals, value, macro, event_risk):
+    """The unrounded final score; also works elementwise on numpy arrays."""
+    weights = FINAL_SCORE_WEIGHTS
+    return (
         technicals * weights['technicals'] +
         catalysts * weights['catalysts'] +
         macro * weights['macro'] +
         value * weights['value'] +
         event_risk * weights['event_risk']
     )
-    
+
+def calculate_final_score(catalysts, technicals, value, macro, event_risk):
+    final_score = weighted_score(catalysts, technicals, value, macro, event_risk)
     return round(final_score, 1)
 
 def get_verdict(score, is_blackout=False):
@@ -572,3 +659,55 @@ def get_verdict(score, is_blackout=False):
         return "Hold", "warning"
     else:
         return "Avoid / Sell", "danger"
+
+def _reference_extrema_mask(values, comparator, order):
+    """scipy.signal._peak_finding._boolrelextrema (mode='clip'), the behaviour relative_extrema_mask must match."""
+    values = np.asarray(values, dtype=np.float64)
+    locs = np.arange(values.shape[0])
+    results = np.ones(values.shape, dtype=bool)
+    main = values.take(locs, axis=0, mode='clip')
+    for shift in range(1, order + 1):
+        results &= comparator(main, values.take(locs + shift, axis=0, mode='clip'))
+        results &= comparator(main, values.take(locs - shift, axis=0, mode='clip'))
+    return results
+
+def _check_extrema(seed=0, trials=2000):
+    """Compare relative_extrema_mask with the scipy reference on random, plateaued and NaN-holed series."""
+    try:
+        from scipy.signal import argrelextrema
+    except ImportError:
+        argrelextrema = None
+    rng = np.random.default_rng(seed)
+    cases = [np.empty(0), np.array([1.0]), np.array([2.0, 2.0]), np.full(7, 3.0), np.array([np.nan] * 4)]
+    for _ in range(trials):
+        length = int(rng.integers(1, 60))
+        values = rng.normal(size=length).cumsum()
+        kind = rng.integers(4)
+        if kind == 1:
+            # Plateaus: repeated values on a coarse grid
+            values = np.round(values)
+        elif kind == 2:
+            values[rng.random(length) < 0.15] = np.nan
+        elif kind == 3:
+            values = rng.integers(0, 3, size=(length, 4)).astype(np.float64)
+        cases.append(values)
+    mismatches = 0
+    for values in cases:
+        # order below, at and beyond the series length
+        for order in (1, 2, 5, max(len(values), 1), len(values) + 3):
+            for comparator in (np.less_equal, np.greater_equal):
+                mask = relative_extrema_mask(values, comparator, order=order)
+                expected = _reference_extrema_mask(values, comparator, order)
+                matches = mask.shape == expected.shape and np.array_equal(mask, expected)
+                if matches and argrelextrema is not None and values.ndim == 1:
+                    matches = np.array_equal(np.flatnonzero(mask), argrelextrema(values, comparator, order=order)[0])
+                if not matches:
+                    mismatches += 1
+                    print(f"mismatch: order={order} {comparator.__name__} values={values.tolist()}")
+    print(f"relative_extrema_mask: {len(cases)} series, {mismatches} mismatches"
+          f"{'' if argrelextrema is not None else ' (scipy not installed, checked against the reference port only)'}")
+    return mismatches == 0
+
+if __name__ == '__main__':
+    # cd backend && python -m scoring_engine
+    raise SystemExit(0 if _check_extrema() else 1)
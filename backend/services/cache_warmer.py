@@ -0,0 +1,145 @@
+import threading
+import logging
+from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
+from sqlalchemy import func
+from models import db, Watchlist, TrafficLog
+from services.rate_limiter import request_priority, PRIORITY_PREFETCH
+from services.caching import retain_entries
+from services import earnings_index
+from services import candle_store
+import data_services
+
+logger = logging.getLogger(__name__)
+
+ANALYZE_PATH_PREFIX = '/api/analyze/'
+
+# Per-ticker datasets analyze_stock_internal reads, warmed in this order
+WARM_DATASETS = {
+    'quote': lambda ticker: data_services.get_stock_quote(ticker),
+    'profile': lambda ticker: data_services.get_stock_profile(ticker),
+    'candles': lambda ticker: data_services.get_historical_prices(ticker, days=730),
+    'analyst': lambda ticker: data_services.get_analyst_recommendations(ticker),
+    'targets': lambda ticker: data_services.get_analyst_price_targets(ticker),
+    'metrics': lambda ticker: data_services.get_key_metrics(ticker),
+    'earnings': lambda ticker: data_services.get_earnings_calendar(ticker),
+}
+
+# One warm at a time per process, run off the request thread
+_warm_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='cache-warm')
+_warm_lock = threading.Lock()
+_warm_status = {'running': False, 'started_at': None, 'tickers': 0, 'last_report': None}
+
+
+def get_watchlist_tickers():
+    items = Watchlist.query.filter(~Watchlist.ticker.startswith('_PLACEHOLDER_')).all()
+    return sorted({item.ticker.upper() for item in items})
+
+
+def get_top_traffic_tickers(limit=20, days=7):
+    """
+    Most-requested tickers over the last `days`, taken from /api/analyze/<ticker>
+    page hits. Only symbols a provider has returned candles for are kept, so bot
+    probes and mistyped tickers never spend warm-up quota.
+    """
+    since = datetime.utcnow() - timedelta(days=days)
+    rows = db.session.query(
+        TrafficLog.page,
+        func.count(TrafficLog.id).label('count')
+    ).filter(
+        TrafficLog.timestamp >= since,
+        TrafficLog.page.startswith(ANALYZE_PATH_PREFIX)
+    ).group_by(
+        TrafficLog.page
+    ).order_by(
+        func.count(TrafficLog.id).desc()
+    ).all()
+
+    tickers = []
+    for row in rows:
+        ticker = row.page[len(ANALYZE_PATH_PREFIX):].strip('/').upper()
+        if ticker and ticker not in tickers and candle_store.has_candles(ticker):
+            tickers.append(ticker)
+        if len(tickers) >= limit:
+            break
+    return tickers
+
+
+def warm_caches(tickers):
+    """
+    Pre-populate the provider caches for `tickers` at prefetch priority, so the
+    warm-up paces itself inside the provider rate limits and never delays
+    interactive analyses. Warmed entries are retained for CACHE_WARM_RETENTION
+    so a run well before the open is still there when traffic arrives.
+    Returns a coverage report.
+    """
+    started = datetime.utcnow()
+    report = {
+        'tickers': len(tickers),
+        'fetches': 0,
+        'warmed': 0,
+        'by_dataset': {name: 0 for name in WARM_DATASETS},
+        'errors': []
+    }
+
+    with request_priority(PRIORITY_PREFETCH), retain_entries():
+        report['fred'] = data_services.get_fred_data() is not None
+        report['earnings_index'] = earnings_index.refresh() is not None
+
+        for ticker in tickers:
+            for name, fetch in WARM_DATASETS.items():
+                report['fetches'] += 1
+                try:
+                    if fetch(ticker) is not None:
+                        report['warmed'] += 1
+                        report['by_dataset'][name] += 1
+                except Exception as e:
+                    logger.warning(f"Cache warm failed for {ticker} {name}: {e}")
+                    report['errors'].append(f"{ticker} {name}: {e}")
+
+    report['coverage'] = round(report['warmed'] / report['fetches'] * 100, 1) if report['fetches'] else 0.0
+    report['seconds'] = round((datetime.utcnow() - started).total_seconds(), 1)
+    logger.info(f"Cache warm: {report['warmed']}/{report['fetches']} datasets for {len(tickers)} tickers ({report['coverage']}%)")
+    return report
+
+
+def start_warm(tickers):
+    """
+    Run warm_caches(tickers) in the background; a warm takes minutes at prefetch
+    pace, far longer than an HTTP request may. Returns False if one is already running.
+    """
+    with _warm_lock:
+        if _warm_status['running']:
+            return False
+        _warm_status.update(running=True, started_at=datetime.utcnow().isoformat(), tickers=len(tickers))
+
+    def run():
+        report = None
+        try:
+            report = warm_caches(tickers)
+        except Exception as e:
+            logger.error(f"Cache warm failed: {e}")
+            report = {'error': str(e)}
+        finally:
+            with _warm_lock:
+                _warm_status.update(running=False, last_report=report)
+
+    _warm_executor.submit(run)
+    return True
+
+
+def warm_status():
+    with _warm_lock:
+        return dict(_warm_status)
+
+
+if __name__ == '__main__':
+    # Scheduled pre-market run: cd backend && python -m services.cache_warmer
+    from app import app
+
+    with app.app_context():
+        warm_tickers = get_watchlist_tickers()
+        for traffic_ticker in get_top_traffic_tickers():
+            if traffic_ticker not in warm_tickers:
+                warm_tickers.append(traffic_ticker)
+        print(warm_caches(warm_tickers))
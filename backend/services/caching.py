@@ -0,0 +1,517 @@
+import os
+import sys
+import time
+import pickle
+import sqlite3
+import threading
+import logging
+import contextvars
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import pandas as pd
+from cachetools import TTLCache, TLRUCache
+from services.rate_limiter import request_priority, PRIORITY_PREFETCH
+
+logger = logging.getLogger(__name__)
+
+# 'memory' is per-process; 'sqlite' (opt-in) shares entries between all gunicorn workers on the host
+CACHE_BACKEND = os.environ.get('CACHE_BACKEND', 'memory')
+# Values are pickled, so the file must live where only the app can write (not a world-writable /tmp)
+CACHE_DB_PATH = os.environ.get(
+    'CACHE_DB_PATH',
+    os.path.join(os.path.dirname(os.path.dirname(__file__)), 'data', 'cache.db')
+)
+# Entries older than their TTL but younger than CACHE_STALE_TTL are served while a background refresh runs
+CACHE_STALE_TTL = int(os.environ.get('CACHE_STALE_TTL', 3600))
+# Hard expiry for entries written by a cache warm, so a pre-market run outlives the wait until the open
+CACHE_WARM_RETENTION = int(os.environ.get('CACHE_WARM_RETENTION', 12 * 3600))
+# Per-namespace size budget; entries are evicted by their approximate size, not their count
+CACHE_MAX_BYTES = int(os.environ.get('CACHE_MAX_BYTES', 32 * 1024 * 1024))
+
+# Lookups that came back empty (unknown/delisted tickers) are remembered briefly, apart from real entries
+NEGATIVE_CACHE_TTL = int(os.environ.get('NEGATIVE_CACHE_TTL', 60))
+NEGATIVE_CACHE_MAXSIZE = int(os.environ.get('NEGATIVE_CACHE_MAXSIZE', 500))
+
+_refresh_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix='cache-refresh')
+
+_retention = contextvars.ContextVar('cache_retention', default=0)
+
+
+class _FetchOutcome:
+    def __init__(self):
+        self.transient_failure = False
+
+
+# Outcome of the fetch_func running in this context (copied into pool threads with the context)
+_fetch_outcome = contextvars.ContextVar('fetch_outcome', default=None)
+
+
+def note_transient_failure():
+    """
+    Mark the fetch running in this context as failed for a transient reason
+    (transport error, timeout, 429/5xx, exhausted rate budget). Provider
+    functions swallow such errors and return None, and this keeps that None
+    from being negative-cached as if the symbol had no data.
+    """
+    outcome = _fetch_outcome.get()
+    if outcome is not None:
+        outcome.transient_failure = True
+
+
+def _run_fetch(fetch_func):
+    """Run fetch_func; returns (data, whether a transient failure was noted). Nested fetches report to their parent."""
+    parent = _fetch_outcome.get()
+    outcome = _FetchOutcome()
+    token = _fetch_outcome.set(outcome)
+    try:
+        data = fetch_func()
+    finally:
+        _fetch_outcome.reset(token)
+        if parent is not None and outcome.transient_failure:
+            parent.transient_failure = True
+    return data, outcome.transient_failure
+
+
+@contextmanager
+def retain_entries(seconds=CACHE_WARM_RETENTION):
+    """Entries cached in this context are kept (served stale while revalidating) for at least `seconds`."""
+    token = _retention.set(seconds)
+    try:
+        yield
+    finally:
+        _retention.reset(token)
+
+
+def approx_size(value):
+    """Approximate memory held by a cached value in bytes; DataFrames and arrays count their buffers."""
+    if isinstance(value, pd.DataFrame):
+        return int(value.memory_usage(deep=True).sum())
+    if isinstance(value, pd.Series):
+        return int(value.memory_usage(deep=True))
+    if isinstance(value, np.ndarray):
+        return sys.getsizeof(value) + (value.nbytes if value.base is not None else 0)
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(approx_size(k) + approx_size(v) for k, v in value.items())
+    if isinstance(value, (list, tuple, set, frozenset)):
+        return sys.getsizeof(value) + sum(approx_size(item) for item in value)
+    return sys.getsizeof(value)
+
+
+class _Call:
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls for the same key into one in-flight execution.
+    The first caller (the leader) runs the function; callers arriving while it is
+    running wait for it and receive the same result, or the same exception.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self._lock = threading.Lock()
+        self._calls = {}
+        self.executed = 0
+        self.coalesced = 0
+
+    def do(self, key, func):
+        with self._lock:
+            call = self._calls.get(key)
+            if call is None:
+                call = _Call()
+                self._calls[key] = call
+                self.executed += 1
+                leader = True
+            else:
+                self.coalesced += 1
+                leader = False
+
+        if not leader:
+            logger.debug(f"Coalesced {self.name} fetch for {key} onto in-flight call")
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = func()
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.event.set()
+
+    def in_flight(self, key):
+        with self._lock:
+            return key in self._calls
+
+    def stats(self):
+        with self._lock:
+            in_flight = len(self._calls)
+        return {
+            'executed': self.executed,
+            'coalesced': self.coalesced,
+            'in_flight': in_flight
+        }
+
+
+class CacheBackend:
+    """
+    Common bookkeeping for cache backends. Entries are fresh for `ttl` seconds
+    and kept (served stale while revalidating) until `stale_ttl`, their hard expiry.
+    Empty results live in a separate, process-local negative cache with its own
+    short TTL and size cap, so they can never evict real entries. Each namespace
+    holds at most `max_bytes`; a value larger than the whole budget is not cached.
+    """
+
+    name = None
+
+    def __init__(self, namespace, max_bytes, ttl, stale_ttl):
+        self.namespace = namespace
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.stale_ttl = max(ttl, stale_ttl)
+        self.stale_hits = 0
+        self.background_refreshes = 0
+        self.negative_hits = 0
+        self.oversized = 0
+        self._negative = TTLCache(maxsize=NEGATIVE_CACHE_MAXSIZE, ttl=NEGATIVE_CACHE_TTL)
+        self._negative_lock = threading.Lock()
+
+    def is_negative(self, key):
+        with self._negative_lock:
+            return key in self._negative
+
+    def set_negative(self, key):
+        with self._negative_lock:
+            self._negative[key] = True
+
+    def clear_negative(self, key):
+        with self._negative_lock:
+            self._negative.pop(key, None)
+
+    def is_fresh(self, stored_at):
+        return time.time() - stored_at < self.ttl
+
+    def retention(self):
+        """Seconds until a value cached now hard-expires: stale_ttl, or longer inside retain_entries()."""
+        return max(self.stale_ttl, _retention.get())
+
+    def get(self, key):
+        entry = self.get_entry(key)
+        return entry[0] if entry is not None else None
+
+    def stats(self):
+        with self._negative_lock:
+            self._negative.expire()
+            negative_entries = len(self._negative)
+        return {
+            'backend': self.name,
+            'entries': len(self),
+            'bytes': self.size_bytes(),
+            'max_bytes': self.max_bytes,
+            'oversized': self.oversized,
+            'stale_hits': self.stale_hits,
+            'background_refreshes': self.background_refreshes,
+            'negative_entries': negative_entries,
+            'negative_hits': self.negative_hits
+        }
+
+
+class MemoryCacheBackend(CacheBackend):
+    """Process-local TTL cache, bounded by the approximate in-memory size of its entries."""
+
+    name = 'memory'
+
+    def __init__(self, namespace, max_bytes, ttl, stale_ttl):
+        super().__init__(namespace, max_bytes, ttl, stale_ttl)
+        # Entries are (value, stored_at, size, retention); the size is measured once, on insert
+        self._cache = TLRUCache(
+            maxsize=max_bytes, ttu=lambda key, entry, now: now + entry[3], getsizeof=lambda entry: entry[2]
+        )
+        # TTLCache is not thread-safe and analyses fetch their inputs concurrently
+        self._lock = threading.Lock()
+
+    def get_entry(self, key):
+        """(value, stored_at) or None."""
+        with self._lock:
+            entry = self._cache.get(key)
+        return entry[:2] if entry is not None else None
+
+    def set(self, key, value):
+        size = approx_size(value)
+        with self._lock:
+            if size > self.max_bytes:
+                self._cache.pop(key, None)
+                self.oversized += 1
+                logger.warning(f"Not caching {key}: {size} bytes exceeds the {self.namespace} budget")
+                return
+            self._cache[key] = (value, time.time(), size, self.retention())
+
+    def retain(self, key):
+        """Push back an entry's hard expiry to retention() from now, keeping its stored_at."""
+        with self._lock:
+            entry = self._cache.get(key)
+            if entry is not None:
+                self._cache[key] = entry[:3] + (self.retention(),)
+
+    def delete(self, key):
+        with self._lock:
+            self._cache.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._cache.clear()
+
+    def __len__(self):
+        with self._lock:
+            self._cache.expire()
+            return len(self._cache)
+
+    def size_bytes(self):
+        with self._lock:
+            self._cache.expire()
+            return self._cache.currsize
+
+
+class SQLiteCacheBackend(CacheBackend):
+    """
+    Host-wide TTL cache stored in a SQLite file, so every worker process reads
+    the entries any other worker fetched. Values are pickled and sized by their
+    pickled length; expiry and the per-namespace byte budget are enforced on write.
+    """
+
+    name = 'sqlite'
+
+    def __init__(self, namespace, max_bytes, ttl, stale_ttl, path=CACHE_DB_PATH):
+        super().__init__(namespace, max_bytes, ttl, stale_ttl)
+        self.path = path
+        self._local = threading.local()
+        self._connect()
+
+    def _connect(self):
+        # Connections must not cross threads or survive a fork
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None and self._local.pid == os.getpid():
+            return conn
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.execute(
+            'CREATE TABLE IF NOT EXISTS cache_entries ('
+            'namespace TEXT NOT NULL, key TEXT NOT NULL, value BLOB NOT NULL, '
+            'stored_at REAL NOT NULL, expires_at REAL NOT NULL, size INTEGER NOT NULL DEFAULT 0, '
+            'PRIMARY KEY (namespace, key))'
+        )
+        columns = [row[1] for row in conn.execute('PRAGMA table_info(cache_entries)')]
+        if 'size' not in columns:
+            try:
+                conn.execute('ALTER TABLE cache_entries ADD COLUMN size INTEGER NOT NULL DEFAULT 0')
+            except sqlite3.OperationalError:
+                # Another worker added it first
+                pass
+        self._local.conn = conn
+        self._local.pid = os.getpid()
+        return conn
+
+    def get_entry(self, key):
+        """(value, stored_at) or None."""
+        # A broken shared cache must degrade to a miss, never fail the request
+        try:
+            row = self._connect().execute(
+                'SELECT value, stored_at FROM cache_entries WHERE namespace = ? AND key = ? AND expires_at > ?',
+                (self.namespace, key, time.time())
+            ).fetchone()
+            if row is None:
+                return None
+            return pickle.loads(row[0]), row[1]
+        except (sqlite3.Error, pickle.UnpicklingError, EOFError, AttributeError, ImportError, IndexError, TypeError, ValueError) as e:
+            # Truncated blobs or ones pickled by incompatible code are a miss; the next set() replaces them
+            logger.warning(f"SQLite cache read failed for {key}: {e}")
+            return None
+
+    def set(self, key, value):
+        now = time.time()
+        try:
+            blob = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+            conn = self._connect()
+            if len(blob) > self.max_bytes:
+                conn.execute('DELETE FROM cache_entries WHERE namespace = ? AND key = ?', (self.namespace, key))
+                self.oversized += 1
+                logger.warning(f"Not caching {key}: {len(blob)} bytes exceeds the {self.namespace} budget")
+                return
+            conn.execute(
+                'INSERT OR REPLACE INTO cache_entries (namespace, key, value, stored_at, expires_at, size) '
+                'VALUES (?, ?, ?, ?, ?, ?)',
+                (self.namespace, key, blob, now, now + self.retention(), len(blob))
+            )
+            conn.execute('DELETE FROM cache_entries WHERE namespace = ? AND expires_at <= ?', (self.namespace, now))
+            # Keep the newest entries that fit in the budget
+            conn.execute(
+                'DELETE FROM cache_entries WHERE namespace = ? AND key IN ('
+                'SELECT key FROM (SELECT key, SUM(size) OVER (ORDER BY stored_at DESC, key) AS running '
+                'FROM cache_entries WHERE namespace = ?) WHERE running > ?)',
+                (self.namespace, self.namespace, self.max_bytes)
+            )
+        except sqlite3.Error as e:
+            logger.warning(f"SQLite cache write failed for {key}: {e}")
+
+    def retain(self, key):
+        """Push back an entry's hard expiry to retention() from now, keeping its stored_at."""
+        try:
+            self._connect().execute(
+                'UPDATE cache_entries SET expires_at = MAX(expires_at, ?) WHERE namespace = ? AND key = ?',
+                (time.time() + self.retention(), self.namespace, key)
+            )
+        except sqlite3.Error as e:
+            logger.warning(f"SQLite cache retain failed for {key}: {e}")
+
+    def delete(self, key):
+        try:
+            self._connect().execute('DELETE FROM cache_entries WHERE namespace = ? AND key = ?', (self.namespace, key))
+        except sqlite3.Error as e:
+            logger.warning(f"SQLite cache delete failed for {key}: {e}")
+
+    def clear(self):
+        try:
+            self._connect().execute('DELETE FROM cache_entries WHERE namespace = ?', (self.namespace,))
+        except sqlite3.Error as e:
+            logger.warning(f"SQLite cache clear failed for {self.namespace}: {e}")
+
+    def __len__(self):
+        try:
+            row = self._connect().execute(
+                'SELECT COUNT(*) FROM cache_entries WHERE namespace = ? AND expires_at > ?',
+                (self.namespace, time.time())
+            ).fetchone()
+        except sqlite3.Error as e:
+            logger.warning(f"SQLite cache count failed for {self.namespace}: {e}")
+            return 0
+        return row[0]
+
+    def size_bytes(self):
+        try:
+            row = self._connect().execute(
+                'SELECT COALESCE(SUM(size), 0) FROM cache_entries WHERE namespace = ? AND expires_at > ?',
+                (self.namespace, time.time())
+            ).fetchone()
+        except sqlite3.Error as e:
+            logger.warning(f"SQLite cache size failed for {self.namespace}: {e}")
+            return 0
+        return row[0]
+
+    def stats(self):
+        stats = super().stats()
+        stats['path'] = self.path
+        return stats
+
+
+def create_cache_backend(namespace, max_bytes=CACHE_MAX_BYTES, ttl=600, stale_ttl=CACHE_STALE_TTL):
+    """Build the cache backend selected by CACHE_BACKEND, falling back to memory."""
+    if CACHE_BACKEND == 'sqlite':
+        try:
+            return SQLiteCacheBackend(namespace, max_bytes, ttl, stale_ttl)
+        except sqlite3.Error as e:
+            logger.warning(f"SQLite cache unavailable at {CACHE_DB_PATH} ({e}), using in-process cache")
+    elif CACHE_BACKEND != 'memory':
+        logger.warning(f"Unknown CACHE_BACKEND '{CACHE_BACKEND}', using in-process cache")
+    return MemoryCacheBackend(namespace, max_bytes, ttl, stale_ttl)
+
+
+def _refresh_in_background(cache, flight, key, fetch_func, covers, flight_key):
+    """Schedule one refresh of a stale entry, unless one is already running."""
+    flight_key = flight_key or key
+    if flight.in_flight(flight_key):
+        return
+    cache.background_refreshes += 1
+    
+    def refresh():
+        def load():
+            entry = cache.get_entry(key)
+            if entry is not None and cache.is_fresh(entry[1]) and (covers is None or covers(entry[0])):
+                return entry[0]
+            data = fetch_func()
+            if data is not None:
+                cache.set(key, data)
+                cache.clear_negative(key)
+            return data
+        
+        # Revalidation is never urgent, so it spends prefetch-priority provider budget
+        try:
+            with request_priority(PRIORITY_PREFETCH):
+                flight.do(flight_key, load)
+        except Exception as e:
+            logger.warning(f"Background refresh of {key} failed: {e}")
+    
+    # A copy of the caller's context, so a refresh triggered by a cache warm keeps its retention
+    _refresh_executor.submit(contextvars.copy_context().run, refresh)
+
+
+def fetch_through(cache, flight, key, fetch_func, covers=None, flight_key=None, refresh_func=None):
+    """
+    Shared get_cached implementation: return the cached value, otherwise run
+    fetch_func once (coalescing concurrent misses) and cache non-None results.
+    Entries past their TTL but before their hard expiry are returned immediately
+    while a background refresh replaces them (stale-while-revalidate). A None
+    result is negative-cached for NEGATIVE_CACHE_TTL seconds, unless the fetch
+    raised or reported a provider failure (note_transient_failure).
+    
+    `covers(value)` lets a caller reject a cached value that cannot serve this
+    request; it is then refetched and replaced. `flight_key` keeps such
+    non-interchangeable fetches for the same cache key from coalescing.
+    `refresh_func(stale_value)` rebuilds a stale entry in the background when
+    it must not shrink to this caller's request (defaults to fetch_func).
+    """
+    def usable(entry):
+        return entry is not None and (covers is None or covers(entry[0]))
+    
+    entry = cache.get_entry(key)
+    if usable(entry):
+        if _retention.get():
+            cache.retain(key)
+        if cache.is_fresh(entry[1]):
+            logger.debug(f"Cache hit for {key}")
+        else:
+            logger.debug(f"Stale cache hit for {key}, revalidating in background")
+            cache.stale_hits += 1
+            if refresh_func is None:
+                _refresh_in_background(cache, flight, key, fetch_func, covers, flight_key)
+            else:
+                # Rebuilds the stored entry whoever asked, so every caller's refresh coalesces on the key
+                stale = entry[0]
+                _refresh_in_background(cache, flight, key, lambda: refresh_func(stale), None, None)
+        return entry[0]
+    
+    if cache.is_negative(key):
+        logger.debug(f"Negative cache hit for {key}")
+        cache.negative_hits += 1
+        return None
+    
+    def load():
+        # A previous leader may have filled the entry since our lookup
+        entry = cache.get_entry(key)
+        if usable(entry):
+            return entry[0]
+        logger.debug(f"Cache miss for {key}, fetching...")
+        data, transient_failure = _run_fetch(fetch_func)
+        if data is not None:
+            cache.set(key, data)
+            cache.clear_negative(key)
+        elif transient_failure:
+            logger.debug(f"Not negative-caching {key}: the provider failed transiently")
+        else:
+            cache.set_negative(key)
+        return data
+    
+    return flight.do(flight_key or key, load)
@@ -0,0 +1,174 @@
+import os
+import logging
+import numpy as np
+import pandas as pd
+from datetime import datetime, timedelta
+from services.snapshots import save_npz_atomic, load_npz, is_valid_symbol, symbol_path
+
+logger = logging.getLogger(__name__)
+
+CANDLE_STORE_DIR = os.environ.get(
+    'CANDLE_STORE_DIR',
+    os.path.join(os.path.dirname(os.path.dirname(__file__)), 'data', 'candles')
+)
+
+COLUMNS = ('open', 'high', 'low', 'close', 'volume')
+
+
+def _store_path(ticker):
+    return symbol_path(CANDLE_STORE_DIR, ticker.upper())
+
+
+def trading_days(dates):
+    """
+    Daily bar stamps (unix seconds or datetimes) as naive midnights of their
+    trading day. Finnhub stamps daily bars 00:00 UTC and MarketData midnight ET
+    (04:00/05:00 UTC); both fall on the trading day's UTC date, so the same
+    session gets the same date from either provider.
+    """
+    if isinstance(dates, pd.Series):
+        return dates.dt.normalize()
+    return pd.to_datetime(dates, unit='s').normalize()
+
+
+def _dedupe_days(df):
+    """Normalize dates to trading days and keep one bar per day (the later one)."""
+    df = df.assign(date=trading_days(df['date']))
+    return df.drop_duplicates(subset='date', keep='last').reset_index(drop=True)
+
+
+def has_candles(ticker):
+    """True if a provider has returned candles for `ticker` before, i.e. it is a real, stored symbol."""
+    ticker = ticker.upper()
+    return is_valid_symbol(ticker) and os.path.exists(_store_path(ticker))
+
+
+def load_candles(ticker, on_restated=None):
+    """
+    Load a symbol's stored daily candles.
+    Returns (DataFrame with date/open/high/low/close/volume, covered_from date) or (None, None).
+    on_restated(ticker) is called when the stored history had to be repaired (see get_candles).
+    """
+    try:
+        arrays = load_npz(_store_path(ticker))
+    except Exception as e:
+        logger.warning(f"Unreadable candle store for {ticker}: {e}")
+        return None, None
+    if arrays is None:
+        return None, None
+    
+    # Dates are stored as unix seconds of each bar's trading day
+    df = pd.DataFrame({'date': pd.to_datetime(arrays['date'], unit='s')})
+    for column in COLUMNS:
+        df[column] = arrays[column]
+    covered_from = datetime.strptime(str(arrays['covered_from']), '%Y-%m-%d').date()
+    
+    # Stores written before dates were normalized can hold provider-specific stamps,
+    # and one day twice when both providers fed it: repair them
+    repaired = _dedupe_days(df)
+    if not repaired['date'].equals(df['date']):
+        dropped = len(df) - len(repaired)
+        if dropped == 0 or on_restated is not None:
+            if dropped:
+                logger.info(f"Candle store: dropped {dropped} duplicate days for {ticker}")
+                on_restated(ticker)
+            save_candles(ticker, repaired, covered_from)
+        # Otherwise the repair is only persisted by a caller that can invalidate what was derived from it
+        df = repaired
+    return df, covered_from
+
+
+def save_candles(ticker, df, covered_from):
+    """Persist a symbol's candles column-wise; covered_from is the earliest date ever requested."""
+    try:
+        _write_candles(ticker, df, covered_from)
+    except Exception as e:
+        logger.warning(f"Could not persist candles for {ticker}: {e}")
+
+
+def _write_candles(ticker, df, covered_from):
+    arrays = {
+        'date': df['date'].values.astype('datetime64[s]').astype(np.int64),
+        'covered_from': np.array(covered_from.strftime('%Y-%m-%d'))
+    }
+    for column in COLUMNS:
+        arrays[column] = df[column].to_numpy()
+    save_npz_atomic(_store_path(ticker), **arrays)
+
+
+def merge_candles(stored, fresh):
+    """Append fresh bars to stored ones; a fresh bar replaces a stored bar of the same trading day."""
+    merged = _dedupe_days(pd.concat([stored, fresh], ignore_index=True))
+    return merged.sort_values('date').reset_index(drop=True)
+
+
+def corrects_history(stored, fresh):
+    """True if `fresh` changes any stored bar before the last one (the last may have been an intraday snapshot)."""
+    overlap = stored.iloc[:-1].merge(fresh, on='date', suffixes=('', '_fresh'))
+    if len(overlap) == 0:
+        return False
+    columns = [column for column in COLUMNS if column in fresh.columns]
+    before = overlap[columns].to_numpy(dtype=np.float64)
+    after = overlap[[f"{column}_fresh" for column in columns]].to_numpy(dtype=np.float64)
+    return not np.array_equal(before, after, equal_nan=True)
+
+
+def window_start(days):
+    return (datetime.now() - timedelta(days=days)).date()
+
+
+def slice_window(candles, days):
+    """Bars dated within the last `days` days, or None if there are none."""
+    window = candles[candles['date'] >= pd.Timestamp(window_start(days))].reset_index(drop=True)
+    return window if len(window) > 0 else None
+
+
+def get_candles(ticker, days, fetch_candles, on_restated=None):
+    """
+    Serve `days` of daily candles for a ticker from the local store, asking the
+    provider only for bars from the last stored date onwards (the last bar is
+    refetched because it may have been an intraday snapshot). A full window is
+    fetched when nothing is stored or the stored history does not reach back
+    far enough.
+    
+    fetch_candles(ticker, days=..., from_date=...) must return a candle
+    DataFrame or None. on_restated(ticker) is called when stored bars change
+    (provider restatements, repaired duplicate days), so the caller can drop
+    state derived from the old history.
+    """
+    ticker = ticker.upper()
+    if not is_valid_symbol(ticker):
+        # Never build a store path from an unexpected symbol: serve it straight from the provider
+        fresh = fetch_candles(ticker, days=days)
+        return slice_window(fresh, days) if fresh is not None and len(fresh) > 0 else None
+    
+    start = window_start(days)
+    stored, covered_from = load_candles(ticker, on_restated)
+    
+    if stored is None or len(stored) == 0 or covered_from > start:
+        fresh = fetch_candles(ticker, days=days)
+        if fresh is None or len(fresh) == 0:
+            # Keep serving whatever history we have rather than nothing
+            candles = stored
+        else:
+            candles = merge_candles(stored, fresh) if stored is not None else fresh
+            if stored is not None and len(stored) > 0 and corrects_history(stored, fresh):
+                # Restated bars (splits, provider corrections) invalidate anything derived from them
+                logger.info(f"Candle store: history corrected for {ticker}")
+                if on_restated is not None:
+                    on_restated(ticker)
+            save_candles(ticker, candles, start if covered_from is None else min(start, covered_from))
+            logger.info(f"Candle store: full fetch for {ticker}, {len(fresh)} bars")
+    else:
+        last_date = stored['date'].iloc[-1].strftime('%Y-%m-%d')
+        fresh = fetch_candles(ticker, from_date=last_date)
+        if fresh is not None and len(fresh) > 0:
+            candles = merge_candles(stored, fresh)
+            save_candles(ticker, candles, covered_from)
+            logger.info(f"Candle store: incremental fetch for {ticker} from {last_date}, {len(fresh)} bars")
+        else:
+            candles = stored
+    
+    if candles is None:
+        return None
+    return slice_window(candles, days)
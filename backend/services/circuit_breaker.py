@@ -0,0 +1,218 @@
+import os
+import time
+import threading
+import contextvars
+import logging
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+import numpy as np
+from services.caching import note_transient_failure
+
+logger = logging.getLogger(__name__)
+
+# Outcomes of the most recent calls a breaker judges a provider by
+CIRCUIT_WINDOW = int(os.environ.get('CIRCUIT_WINDOW', 50))
+CIRCUIT_MIN_CALLS = int(os.environ.get('CIRCUIT_MIN_CALLS', 10))
+CIRCUIT_ERROR_RATE = float(os.environ.get('CIRCUIT_ERROR_RATE', 0.5))
+# How long an open breaker sends traffic elsewhere before letting one probe call through
+CIRCUIT_OPEN_SECONDS = float(os.environ.get('CIRCUIT_OPEN_SECONDS', 30))
+
+# A hedged call starts the fallback once the primary is slower than this latency percentile
+HEDGE_PERCENTILE = float(os.environ.get('HEDGE_PERCENTILE', 95))
+# Hedge delay used until the primary has CIRCUIT_MIN_CALLS successful samples
+HEDGE_DEFAULT_DELAY = float(os.environ.get('HEDGE_DEFAULT_DELAY', 2.0))
+HEDGE_MIN_DELAY = 0.25
+
+_hedge_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix='hedge')
+
+
+class CircuitBreaker:
+    """
+    Tracks one provider's error rate and latency over its last CIRCUIT_WINDOW
+    calls. The breaker opens when at least CIRCUIT_ERROR_RATE of them failed;
+    after CIRCUIT_OPEN_SECONDS it lets a single probe through, and the next
+    recorded outcome closes it again or restarts the open period.
+    """
+
+    def __init__(self, provider):
+        self.provider = provider
+        self._outcomes = deque(maxlen=CIRCUIT_WINDOW)
+        self._opened_at = None
+        self._probe_started = None
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.errors = 0
+        self.opened = 0
+
+    def _admits(self, now):
+        if self._opened_at is None:
+            return True
+        if now - self._opened_at < CIRCUIT_OPEN_SECONDS:
+            return False
+        # A probe that never reported back (e.g. it timed out in the rate limiter) expires
+        return self._probe_started is None or now - self._probe_started >= CIRCUIT_OPEN_SECONDS
+
+    def available(self):
+        """Whether allow() would let a call through now, without claiming the half-open probe."""
+        with self._lock:
+            return self._admits(time.monotonic())
+
+    def allow(self):
+        """Whether a caller that has an alternative should use this provider now; claims the probe when half-open."""
+        with self._lock:
+            now = time.monotonic()
+            if not self._admits(now):
+                return False
+            if self._opened_at is not None:
+                self._probe_started = now
+            return True
+
+    def record(self, ok, latency):
+        with self._lock:
+            self.calls += 1
+            if not ok:
+                self.errors += 1
+            self._outcomes.append((ok, latency))
+
+            if self._opened_at is not None:
+                self._probe_started = None
+                if ok:
+                    logger.info(f"Circuit for {self.provider} closed")
+                    self._opened_at = None
+                    self._outcomes.clear()
+                else:
+                    self._opened_at = time.monotonic()
+                return
+
+            failures = sum(1 for outcome_ok, _ in self._outcomes if not outcome_ok)
+            if len(self._outcomes) >= CIRCUIT_MIN_CALLS and failures / len(self._outcomes) >= CIRCUIT_ERROR_RATE:
+                logger.warning(f"Circuit for {self.provider} opened: {failures}/{len(self._outcomes)} recent calls failed")
+                self._opened_at = time.monotonic()
+                self.opened += 1
+
+    def latency_percentile(self, percentile):
+        """Latency percentile of recent successful calls, or None without enough samples."""
+        with self._lock:
+            latencies = [latency for ok, latency in self._outcomes if ok]
+        if len(latencies) < CIRCUIT_MIN_CALLS:
+            return None
+        return float(np.percentile(latencies, percentile))
+
+    def hedge_delay(self):
+        delay = self.latency_percentile(HEDGE_PERCENTILE)
+        if delay is None:
+            return HEDGE_DEFAULT_DELAY
+        return max(delay, HEDGE_MIN_DELAY)
+
+    def state(self):
+        with self._lock:
+            if self._opened_at is None:
+                return 'closed'
+            if time.monotonic() - self._opened_at < CIRCUIT_OPEN_SECONDS:
+                return 'open'
+            return 'half_open'
+
+    def stats(self):
+        with self._lock:
+            recent = len(self._outcomes)
+            recent_errors = sum(1 for ok, _ in self._outcomes if not ok)
+        p50 = self.latency_percentile(50)
+        p95 = self.latency_percentile(95)
+        return {
+            'state': self.state(),
+            'calls': self.calls,
+            'errors': self.errors,
+            'opened': self.opened,
+            'recent_error_rate': round(recent_errors / recent, 3) if recent else 0.0,
+            'p50_seconds': round(p50, 3) if p50 is not None else None,
+            'p95_seconds': round(p95, 3) if p95 is not None else None,
+            'hedge_delay_seconds': round(self.hedge_delay(), 3)
+        }
+
+
+breakers = {
+    'marketdata': CircuitBreaker('marketdata'),
+    'finnhub': CircuitBreaker('finnhub')
+}
+
+
+def record(provider, ok, latency):
+    breakers[provider].record(ok, latency)
+
+
+def allow(provider):
+    return breakers[provider].allow()
+
+
+def available(provider):
+    return breakers[provider].available()
+
+
+def _usable(result):
+    return result is not None and not (hasattr(result, '__len__') and len(result) == 0)
+
+
+def hedged_call(primary_provider, primary, fallback_provider, fallback):
+    """
+    Run `primary`, hedging with `fallback` when the primary is unhealthy or slow:
+    - primary's breaker open and fallback's closed: only the fallback runs
+    - primary still running after its hedge delay (HEDGE_PERCENTILE latency):
+      the fallback starts too, and the first usable answer wins
+    - primary returns nothing or raises: the fallback runs
+    - both breakers open: neither provider is called
+    Returns None when neither produces a usable (non-None, non-empty) result.
+    The fallback's half-open probe is only claimed when the fallback actually runs.
+    """
+    if not allow(primary_provider):
+        if allow(fallback_provider):
+            logger.info(f"{primary_provider} circuit open, using {fallback_provider}")
+            return fallback()
+        logger.warning(f"{primary_provider} and {fallback_provider} circuits open, skipping the call")
+        # An outage, not an empty answer: keep it out of the negative cache
+        note_transient_failure()
+        return None
+
+    def submit(func):
+        # Keep the caller's rate-limit priority in the pool thread
+        return _hedge_executor.submit(contextvars.copy_context().run, func)
+
+    def result_of(future):
+        try:
+            return future.result()
+        except Exception as e:
+            logger.warning(f"Hedged call failed: {e}")
+            return None
+
+    primary_future = submit(primary)
+    wait([primary_future], timeout=breakers[primary_provider].hedge_delay())
+    if primary_future.done():
+        result = result_of(primary_future)
+        if _usable(result) or not allow(fallback_provider):
+            return result
+        return fallback()
+
+    if not available(fallback_provider):
+        return result_of(primary_future)
+
+    def claimed_fallback():
+        # Claim the breaker when the hedge starts running, not when it is queued
+        if not allow(fallback_provider):
+            return None
+        return fallback()
+
+    logger.info(f"{primary_provider} slower than its p{HEDGE_PERCENTILE:g}, hedging with {fallback_provider}")
+    pending = {primary_future, submit(claimed_fallback)}
+    while pending:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            result = result_of(future)
+            if _usable(result):
+                # A hedge still queued never starts, so it never claims the probe
+                for other in pending:
+                    other.cancel()
+                return result
+    return None
+
+
+def get_stats():
+    return {provider: breaker.stats() for provider, breaker in breakers.items()}
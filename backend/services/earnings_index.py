@@ -0,0 +1,217 @@
+import os
+import threading
+import logging
+import numpy as np
+from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
+from services import finnhub_service
+from services.rate_limiter import request_priority, PRIORITY_PREFETCH
+from services.snapshots import save_npz_atomic, load_npz
+
+logger = logging.getLogger(__name__)
+
+EARNINGS_INDEX_FILE = os.environ.get(
+    'EARNINGS_INDEX_FILE',
+    os.path.join(os.path.dirname(os.path.dirname(__file__)), 'data', 'earnings_index.npz')
+)
+EARNINGS_INDEX_TTL_HOURS = float(os.environ.get('EARNINGS_INDEX_TTL_HOURS', 24))
+# Window fetched around today; the lookback covers the post-earnings blackout
+EARNINGS_INDEX_DAYS = int(os.environ.get('EARNINGS_INDEX_DAYS', 90))
+EARNINGS_LOOKBACK_DAYS = 5
+# The range is requested in chunks so no single response gets truncated
+EARNINGS_INDEX_CHUNK_DAYS = 7
+# After a failed refresh, keep serving what we have for this long before trying again
+EARNINGS_INDEX_RETRY_MINUTES = 15
+
+# symbol -> ((date, time), ...) sorted by date, shared by every request in this process
+_index = None
+_index_timestamp = None
+_last_failure = None
+_lock = threading.Lock()
+_refresh_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='earnings-index')
+
+
+def _age_hours(timestamp):
+    return (datetime.now() - timestamp).total_seconds() / 3600
+
+
+def _is_fresh(timestamp):
+    return timestamp is not None and _age_hours(timestamp) < EARNINGS_INDEX_TTL_HOURS
+
+
+def _build_index(symbols, dates, times):
+    index = {}
+    for symbol, date, time in sorted(zip(symbols, dates, times), key=lambda row: (row[0], row[1])):
+        index.setdefault(symbol, []).append((date, time))
+    return {symbol: tuple(reports) for symbol, reports in index.items()}
+
+
+def _load_snapshot():
+    """Decode the earnings index snapshot. Returns (index, fetched_at) or (None, None)."""
+    try:
+        arrays = load_npz(EARNINGS_INDEX_FILE)
+        if arrays is None:
+            return None, None
+        index = _build_index(arrays['symbol'].tolist(), arrays['date'].tolist(), arrays['time'].tolist())
+        return index, datetime.fromisoformat(str(arrays['timestamp']))
+    except Exception as e:
+        logger.warning(f"Error loading earnings index snapshot: {e}")
+    return None, None
+
+
+def _save_snapshot(index, fetched_at):
+    try:
+        rows = [(symbol, date, time) for symbol, reports in index.items() for date, time in reports]
+        save_npz_atomic(
+            EARNINGS_INDEX_FILE,
+            symbol=np.array([row[0] for row in rows], dtype=str),
+            date=np.array([row[1] for row in rows], dtype=str),
+            time=np.array([row[2] for row in rows], dtype=str),
+            timestamp=np.array(fetched_at.isoformat())
+        )
+    except Exception as e:
+        logger.warning(f"Error saving earnings index snapshot: {e}")
+
+
+def fetch_ranges(today):
+    """The (from, to) date strings the index window is requested in."""
+    start = today - timedelta(days=EARNINGS_LOOKBACK_DAYS)
+    end = today + timedelta(days=EARNINGS_INDEX_DAYS)
+    ranges = []
+    chunk_start = start
+    while chunk_start <= end:
+        chunk_end = min(chunk_start + timedelta(days=EARNINGS_INDEX_CHUNK_DAYS - 1), end)
+        ranges.append((chunk_start.strftime('%Y-%m-%d'), chunk_end.strftime('%Y-%m-%d')))
+        chunk_start = chunk_end + timedelta(days=1)
+    return ranges
+
+
+def _fetch_index():
+    """Fetch every symbol's reports in the index window from Finnhub; raises if nothing comes back."""
+    ranges = fetch_ranges(datetime.now().date())
+
+    symbols, dates, times = [], [], []
+    for from_date, to_date in ranges:
+        calendar = finnhub_service.get_earnings_range(from_date, to_date)
+        if calendar is None:
+            raise ValueError(f"no earnings calendar for {from_date} to {to_date}")
+        for report in calendar:
+            if report.get('symbol') and report.get('date'):
+                symbols.append(report['symbol'].upper())
+                dates.append(report['date'])
+                times.append('BMO' if report.get('hour') == 'bmo' else 'AMC')
+
+    # An empty calendar for a whole quarter means the call failed, not that nobody reports
+    if not symbols:
+        raise ValueError("earnings calendar came back empty")
+    logger.info(f"Earnings index: {len(symbols)} reports for {len(set(symbols))} symbols, {ranges[0][0]} to {ranges[-1][1]}")
+    return _build_index(symbols, dates, times)
+
+
+def refresh():
+    """
+    Bring the index up to date: adopt a fresher snapshot written by another
+    worker, otherwise rebuild it from Finnhub. A failed rebuild keeps the
+    current index and is not retried for EARNINGS_INDEX_RETRY_MINUTES.
+    Returns the index, or None if none is available.
+    """
+    global _index, _index_timestamp, _last_failure
+
+    with _lock:
+        if _index is not None and _is_fresh(_index_timestamp):
+            return _index
+
+        snapshot_index, snapshot_time = _load_snapshot()
+        if snapshot_index is not None and (_index_timestamp is None or snapshot_time > _index_timestamp):
+            _index, _index_timestamp = snapshot_index, snapshot_time
+            if _is_fresh(snapshot_time):
+                logger.info(f"Earnings index snapshot hit - age: {_age_hours(snapshot_time):.1f} hours")
+                return _index
+
+        if _last_failure is not None and datetime.now() - _last_failure < timedelta(minutes=EARNINGS_INDEX_RETRY_MINUTES):
+            return _index
+
+        try:
+            index = _fetch_index()
+        except Exception as e:
+            logger.error(f"Earnings index refresh failed: {e}")
+            _last_failure = datetime.now()
+            return _index
+
+        fetched_at = datetime.now()
+        _save_snapshot(index, fetched_at)
+        _index, _index_timestamp, _last_failure = index, fetched_at, None
+        return _index
+
+
+def _refresh_in_background():
+    def run():
+        try:
+            with request_priority(PRIORITY_PREFETCH):
+                refresh()
+        except Exception as e:
+            logger.warning(f"Background earnings index refresh failed: {e}")
+
+    if not _lock.locked():
+        _refresh_executor.submit(run)
+
+
+def _adopt_snapshot():
+    """
+    Load the snapshot into a process that has no index yet, without waiting for
+    a rebuild that holds the lock. Returns the snapshot index or None.
+    """
+    global _index, _index_timestamp
+
+    snapshot_index, snapshot_time = _load_snapshot()
+    if snapshot_index is not None and _lock.acquire(blocking=False):
+        try:
+            if _index is None:
+                _index, _index_timestamp = snapshot_index, snapshot_time
+        finally:
+            _lock.release()
+    return snapshot_index
+
+
+def get_index():
+    """
+    The current index. A stale index is returned at once while it is rebuilt in
+    the background. A process with no index reads the snapshot; without one it
+    returns None (callers fall back to per-ticker lookups) while the index is
+    built in the background at prefetch priority.
+    """
+    if _index is not None and _is_fresh(_index_timestamp):
+        return _index
+    index = _index if _index is not None else _adopt_snapshot()
+    if index is None or _index is None or not _is_fresh(_index_timestamp):
+        _refresh_in_background()
+    return index
+
+
+def get_next_earnings(ticker):
+    """
+    Next report for `ticker` in the same shape as the per-ticker calendar lookups
+    (a one-item list), or None if no index is available or the ticker has no
+    report within the index window. Callers then fall back to a per-ticker call,
+    which also finds reports beyond EARNINGS_INDEX_DAYS.
+    """
+    index = get_index()
+    if index is None:
+        return None
+    ticker = ticker.upper()
+    cutoff = (datetime.now().date() - timedelta(days=EARNINGS_LOOKBACK_DAYS)).strftime('%Y-%m-%d')
+    for date, time in index.get(ticker, ()):
+        if date >= cutoff:
+            return [{'date': date, 'time': time, 'symbol': ticker, 'source': 'finnhub'}]
+    return None
+
+
+def stats():
+    index = _index
+    return {
+        'symbols': len(index) if index is not None else 0,
+        'reports': sum(len(reports) for reports in index.values()) if index is not None else 0,
+        'age_hours': round(_age_hours(_index_timestamp), 2) if _index_timestamp is not None else None,
+        'last_failure': _last_failure.isoformat() if _last_failure is not None else None,
+        'path': EARNINGS_INDEX_FILE
+    }
@@ -1,27 +1,70 @@
 import os
+import time
 import finnhub
 from datetime import datetime, timedelta
-from cachetools import TTLCache
 import logging
+from services.caching import SingleFlight, create_cache_backend, fetch_through, note_transient_failure
+from services import rate_limiter
+from services import circuit_breaker
+from services import provider_replay
+from services import candle_store
 
 logger = logging.getLogger(__name__)
 
 FINNHUB_API_KEY = os.environ.get('FINNHUB_API_KEY')
 
-finnhub_client = finnhub.Client(api_key=FINNHUB_API_KEY)
+def _is_provider_failure(error):
+    """Network errors, 429 and 5xx count against Finnhub; 4xx (e.g. premium-only endpoints) do not."""
+    status = getattr(error, 'status_code', None)
+    return status is None or status == 429 or status >= 500
 
-cache = TTLCache(maxsize=100, ttl=600)
+class RateLimitedClient:
+    """
+    Proxy for finnhub.Client that takes a token from the shared rate limiter before
+    every API call and reports each call's outcome to the Finnhub circuit breaker.
+    Calls go through provider_replay, so PROVIDER_MODE can record or replay them.
+    """
+    
+    def __init__(self, client):
+        self._client = client
+    
+    def __getattr__(self, name):
+        attr = getattr(self._client, name)
+        if not callable(attr):
+            return attr
+        
+        def live_call(*args, **kwargs):
+            try:
+                rate_limiter.acquire('finnhub')
+            except rate_limiter.RateLimitTimeout:
+                note_transient_failure()
+                raise
+            started = time.monotonic()
+            try:
+                result = attr(*args, **kwargs)
+            except Exception as e:
+                failed = _is_provider_failure(e)
+                circuit_breaker.record('finnhub', not failed, time.monotonic() - started)
+                if failed:
+                    note_transient_failure()
+                raise
+            circuit_breaker.record('finnhub', True, time.monotonic() - started)
+            return result
+        
+        def call(*args, **kwargs):
+            key = provider_replay.request_key(*args, **kwargs)
+            return provider_replay.through('finnhub', name, key, lambda: live_call(*args, **kwargs))
+        return call
+
+finnhub_client = RateLimitedClient(finnhub.Client(api_key=FINNHUB_API_KEY))
+
+cache = create_cache_backend('finnhub', ttl=600)
+# Concurrent misses on the same key share one upstream fetch
+flight = SingleFlight('finnhub')
 
 def get_cached(key, fetch_func):
-    if key in cache:
-        logger.debug(f"Cache hit for {key}")
-        return cache[key]
-    logger.debug(f"Cache miss for {key}, fetching...")
     try:
-        data = fetch_func()
-        if data is not None:
-            cache[key] = data
-        return data
+        return fetch_through(cache, flight, key, fetch_func)
     except Exception as e:
         logger.error(f"Error fetching {key}: {e}")
         return None
@@ -45,8 +88,7 @@ def get_basic_financials(ticker):
                 'dividend_yield': metric.get('dividendYieldIndicatedAnnual'),
                 'beta': metric.get('beta'),
                 'eps_ttm': metric.get('epsBasicExclExtraItemsTTM'),
-                'revenue_per_share_ttm': metric.get('revenuePerShareTTM'),
-                'raw_metric': metric
+                'revenue_per_share_ttm': metric.get('revenuePerShareTTM')
             }
         return None
     
@@ -169,42 +211,59 @@ def get_earnings_calendar(ticker):
     return get_cached(key, fetch)
 
 
-def get_stock_candles(ticker, days=120):
+def get_earnings_range(from_date, to_date):
+    """
+    Get the earnings calendar for every symbol reporting between two dates
+    (YYYY-MM-DD) in one call. Uncached; services.earnings_index keeps the result.
     """
-    Get historical OHLCV data from Finnhub stock_candles endpoint.
+    earnings = finnhub_client.earnings_calendar(_from=from_date, to=to_date, symbol='')
+    if earnings and 'earningsCalendar' in earnings:
+        return earnings['earningsCalendar']
+    return None
+
+
+def fetch_stock_candles(ticker, days=120, from_date=None):
+    """
+    Get historical OHLCV data from Finnhub stock_candles endpoint, uncached.
+    Covers the last `days` days, or from `from_date` (YYYY-MM-DD) to today when given,
+    matching marketdata_service.get_historical_candles so either can feed the candle store.
     Returns a pandas DataFrame with columns: date, open, high, low, close, volume
     """
     import pandas as pd
     
-    key = f"finnhub_candles_{ticker}_{days}"
-    
-    def fetch():
-        try:
-            end_timestamp = int(datetime.now().timestamp())
+    try:
+        end_timestamp = int(datetime.now().timestamp())
+        if from_date is not None:
+            start_timestamp = int(datetime.strptime(from_date, '%Y-%m-%d').timestamp())
+        else:
             start_timestamp = int((datetime.now() - timedelta(days=days)).timestamp())
-            
-            data = finnhub_client.stock_candles(ticker, 'D', start_timestamp, end_timestamp)
-            
-            if data and data.get('s') == 'ok':
-                df = pd.DataFrame({
-                    'date': pd.to_datetime(data['t'], unit='s'),
-                    'open': data['o'],
-                    'high': data['h'],
-                    'low': data['l'],
-                    'close': data['c'],
-                    'volume': data['v']
-                })
-                df = df.sort_values('date').reset_index(drop=True)
-                logger.info(f"Finnhub candles for {ticker}: {len(df)} rows")
-                return df
-            else:
-                logger.warning(f"Finnhub candles returned no data for {ticker}: {data}")
-                return None
-        except Exception as e:
-            logger.error(f"Error fetching Finnhub candles for {ticker}: {e}")
+        
+        data = finnhub_client.stock_candles(ticker, 'D', start_timestamp, end_timestamp)
+        
+        if data and data.get('s') == 'ok':
+            df = pd.DataFrame({
+                'date': candle_store.trading_days(data['t']),
+                'open': data['o'],
+                'high': data['h'],
+                'low': data['l'],
+                'close': data['c'],
+                'volume': data['v']
+            })
+            df = df.sort_values('date').reset_index(drop=True)
+            logger.info(f"Finnhub candles for {ticker}: {len(df)} rows")
+            return df
+        else:
+            logger.warning(f"Finnhub candles returned no data for {ticker}: {data}")
             return None
-    
-    return get_cached(key, fetch)
+    except Exception as e:
+        logger.error(f"Error fetching Finnhub candles for {ticker}: {e}")
+        return None
+
+
+def get_stock_candles(ticker, days=120):
+    """Cached fetch_stock_candles for the last `days` days."""
+    key = f"finnhub_candles_{ticker}_{days}"
+    return get_cached(key, lambda: fetch_stock_candles(ticker, days=days))
 
 
 def get_company_profile(ticker):
@@ -0,0 +1,90 @@
+import os
+import random
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+HTTP_CONNECT_TIMEOUT = float(os.environ.get('HTTP_CONNECT_TIMEOUT', 3.05))
+HTTP_READ_TIMEOUT = float(os.environ.get('HTTP_READ_TIMEOUT', 10))
+HTTP_MAX_RETRIES = int(os.environ.get('HTTP_MAX_RETRIES', 2))
+HTTP_BACKOFF_FACTOR = float(os.environ.get('HTTP_BACKOFF_FACTOR', 0.5))
+HTTP_BACKOFF_JITTER = float(os.environ.get('HTTP_BACKOFF_JITTER', 0.5))
+# Longest a retry may wait, whatever Retry-After asks for
+HTTP_MAX_RETRY_WAIT = float(os.environ.get('HTTP_MAX_RETRY_WAIT', 5))
+# Raise for scanner bursts: connections kept alive per host
+HTTP_POOL_SIZE = int(os.environ.get('HTTP_POOL_SIZE', 20))
+
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+
+_session = None
+_session_pid = None
+_session_lock = threading.Lock()
+
+
+def create_session(pool_size=HTTP_POOL_SIZE, max_retries=HTTP_MAX_RETRIES):
+    """
+    Build a keep-alive Session that retries only failed connections, with a
+    bounded, jittered backoff: those never reached the provider, so they cost
+    no quota. Retrying 429/5xx answers spends provider budget and is left to
+    the caller (see retry_delay). The final response is returned rather than
+    raised so callers keep their existing status-code handling.
+    """
+    retry = Retry(
+        total=max_retries,
+        connect=max_retries,
+        read=0,
+        status=0,
+        backoff_factor=HTTP_BACKOFF_FACTOR,
+        backoff_jitter=HTTP_BACKOFF_JITTER,
+        backoff_max=HTTP_MAX_RETRY_WAIT,
+        allowed_methods=frozenset(['GET', 'HEAD']),
+        respect_retry_after_header=False,
+        raise_on_status=False
+    )
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+    session = requests.Session()
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+def get_session():
+    """Process-wide pooled session, recreated after a fork (gunicorn workers)."""
+    global _session, _session_pid
+    pid = os.getpid()
+    if _session is None or _session_pid != pid:
+        with _session_lock:
+            if _session is None or _session_pid != pid:
+                _session = create_session()
+                _session_pid = pid
+    return _session
+
+
+def get(url, timeout=None, **kwargs):
+    """GET through the pooled session with connect/read timeouts always applied."""
+    if timeout is None:
+        timeout = (HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT)
+    return get_session().get(url, timeout=timeout, **kwargs)
+
+
+def should_retry(response, attempt, max_retries=HTTP_MAX_RETRIES):
+    """True if `response` is a retryable 429/5xx and attempt (0-based) has retries left."""
+    return response.status_code in RETRY_STATUS_CODES and attempt < max_retries
+
+
+def retry_delay(response, attempt):
+    """
+    Seconds to wait before retrying `response`: its Retry-After when present,
+    otherwise a jittered exponential backoff, never more than HTTP_MAX_RETRY_WAIT.
+    """
+    delay = None
+    retry_after = response.headers.get('Retry-After')
+    if retry_after:
+        try:
+            delay = Retry(0).parse_retry_after(retry_after)
+        except Exception:
+            delay = None
+    if delay is None:
+        delay = HTTP_BACKOFF_FACTOR * (2 ** attempt) + random.uniform(0, HTTP_BACKOFF_JITTER)
+    return max(0.0, min(delay, HTTP_MAX_RETRY_WAIT))
@@ -1,7 +1,13 @@
-import requests
 import os
+import time
 import pandas as pd
 from datetime import datetime, timedelta
+from services import http_client
+from services import rate_limiter
+from services import circuit_breaker
+from services import provider_replay
+from services import candle_store
+from services.caching import note_transient_failure
 
 BASE_URL = "https://api.marketdata.app/v1"
 
@@ -12,16 +18,59 @@ def get_headers():
         return {}
     return {"Authorization": f"Bearer {token}"}
 
-def get_historical_candles(ticker, days=120):
+def api_get(url, **kwargs):
+    """
+    GET a MarketData endpoint once the shared rate limiter grants a token.
+    429/5xx answers are retried after a bounded wait, each retry taking its
+    own token. Every attempt feeds the MarketData circuit breaker: transport
+    errors, 429 and 5xx count as failures, and latency excludes time spent
+    queueing. Goes through provider_replay, so PROVIDER_MODE can record or
+    replay it.
+    """
+    def live():
+        attempt = 0
+        while True:
+            try:
+                rate_limiter.acquire('marketdata')
+            except rate_limiter.RateLimitTimeout:
+                note_transient_failure()
+                raise
+            started = time.monotonic()
+            try:
+                response = http_client.get(url, **kwargs)
+            except Exception:
+                circuit_breaker.record('marketdata', False, time.monotonic() - started)
+                note_transient_failure()
+                raise
+            ok = response.status_code < 500 and response.status_code != 429
+            circuit_breaker.record('marketdata', ok, time.monotonic() - started)
+            if not http_client.should_retry(response, attempt):
+                if not ok:
+                    note_transient_failure()
+                return response
+            time.sleep(http_client.retry_delay(response, attempt))
+            attempt += 1
+    
+    path = url[len(BASE_URL):].strip('/')
+    # The date range is left out of the key: a recorded window also serves later incremental fetches
+    params = {k: v for k, v in (kwargs.get('params') or {}).items() if k not in ('from', 'to')}
+    return provider_replay.through(
+        'marketdata', '/'.join(path.split('/')[:2]), provider_replay.request_key(path, params), live,
+        encode=provider_replay.encode_response, decode=provider_replay.decode_response
+    )
+
+def get_historical_candles(ticker, days=120, from_date=None):
     """
     Fetches historical daily OHLCV candles from MarketData.app.
+    Covers the last `days` days, or from `from_date` (YYYY-MM-DD) to today when given.
     Returns DataFrame with columns: date, open, high, low, close, volume
     """
     ticker = ticker.upper()
     url = f"{BASE_URL}/stocks/candles/D/{ticker}/"
     
     to_date = datetime.now().strftime('%Y-%m-%d')
-    from_date = (datetime.now() - timedelta(days=days)).strftime('%Y-%m-%d')
+    if from_date is None:
+        from_date = (datetime.now() - timedelta(days=days)).strftime('%Y-%m-%d')
     
     params = {
         'from': from_date,
@@ -30,13 +79,13 @@ def get_historical_candles(ticker, days=120):
     }
     
     try:
-        response = requests.get(url, headers=get_headers(), params=params)
+        response = api_get(url, headers=get_headers(), params=params)
         if response.status_code in [200, 203]:
             data = response.json()
             
             if data.get('s') == 'ok' and data.get('t'):
                 df = pd.DataFrame({
-                    'date': pd.to_datetime(data['t'], unit='s'),
+                    'date': candle_store.trading_days(data['t']),
                     'open': data['o'],
                     'high': data['h'],
                     'low': data['l'],
@@ -62,7 +111,7 @@ def get_realtime_price(ticker):
     
     try:
         params = {'52week': 'true'}
-        response = requests.get(url, headers=get_headers(), params=params)
+        response = api_get(url, headers=get_headers(), params=params)
         if response.status_code in [200, 203]:
             data = response.json()
             
@@ -95,7 +144,7 @@ def get_earnings_calendar(ticker):
     url = f"{BASE_URL}/stocks/earnings/{ticker}/"
     
     try:
-        response = requests.get(url, headers=get_headers())
+        response = api_get(url, headers=get_headers())
         if response.status_code in [200, 203]:
             data = response.json()
             
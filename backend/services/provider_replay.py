@@ -0,0 +1,149 @@
+import os
+import re
+import json
+import time
+import random
+import hashlib
+import logging
+from datetime import date, datetime
+from services.snapshots import save_json_atomic, load_json
+
+logger = logging.getLogger(__name__)
+
+# 'live' calls the providers; 'record' calls them and saves each response as a
+# fixture; 'replay' serves fixtures only and never touches the network
+PROVIDER_MODE = os.environ.get('PROVIDER_MODE', 'live')
+PROVIDER_FIXTURE_DIR = os.environ.get(
+    'PROVIDER_FIXTURE_DIR',
+    os.path.join(os.path.dirname(os.path.dirname(__file__)), 'data', 'fixtures')
+)
+# Injected per-call latency in replay mode: REPLAY_LATENCY_MS plus up to REPLAY_LATENCY_JITTER_MS
+REPLAY_LATENCY_MS = float(os.environ.get('REPLAY_LATENCY_MS', 0))
+REPLAY_LATENCY_JITTER_MS = float(os.environ.get('REPLAY_LATENCY_JITTER_MS', 0))
+
+DATE_PATTERN = re.compile(r'^\d{4}-\d{2}-\d{2}$')
+# Integers in this range are unix timestamps (2001-2096)
+TIMESTAMP_RANGE = (1_000_000_000, 4_000_000_000)
+
+
+class FixtureNotFound(Exception):
+    pass
+
+
+class ReplayedProviderError(Exception):
+    """A provider error captured while recording, raised again on replay."""
+
+    def __init__(self, message, status_code=None):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def _normalize(value, today):
+    if isinstance(value, str) and DATE_PATTERN.match(value):
+        return f"{(datetime.strptime(value, '%Y-%m-%d').date() - today).days}d"
+    if isinstance(value, dict):
+        return {k: _normalize(v, today) for k, v in sorted(value.items()) if not _is_timestamp(v)}
+    if isinstance(value, (list, tuple)):
+        return [_normalize(v, today) for v in value if not _is_timestamp(v)]
+    return value
+
+
+def _is_timestamp(value):
+    return isinstance(value, int) and not isinstance(value, bool) and TIMESTAMP_RANGE[0] <= value < TIMESTAMP_RANGE[1]
+
+
+def request_key(*args, **kwargs):
+    """
+    Fixture key for a provider call. Dates become day offsets from today and unix
+    timestamps are dropped, so a fixture recorded on one day still matches the
+    same call made on another.
+    """
+    today = date.today()
+    return {'args': _normalize(list(args), today), 'kwargs': _normalize(kwargs, today)}
+
+
+def fixture_path(provider, endpoint, key):
+    digest = hashlib.sha1(json.dumps(key, sort_keys=True).encode('utf-8')).hexdigest()[:20]
+    slug = re.sub(r'[^A-Za-z0-9_.-]+', '_', endpoint).strip('_')
+    return os.path.join(PROVIDER_FIXTURE_DIR, provider, slug, f"{digest}.json")
+
+
+def write_fixture(provider, endpoint, key, response=None, error=None, status_code=None):
+    fixture = {'provider': provider, 'endpoint': endpoint, 'key': key, 'recorded_at': datetime.now().isoformat()}
+    if error is not None:
+        fixture['error'] = error
+        fixture['status_code'] = status_code
+    else:
+        fixture['response'] = response
+    save_json_atomic(fixture_path(provider, endpoint, key), fixture)
+
+
+def _replay(provider, endpoint, key, decode):
+    fixture = load_json(fixture_path(provider, endpoint, key))
+    if REPLAY_LATENCY_MS or REPLAY_LATENCY_JITTER_MS:
+        time.sleep((REPLAY_LATENCY_MS + random.uniform(0, REPLAY_LATENCY_JITTER_MS)) / 1000)
+    if fixture is None:
+        raise FixtureNotFound(f"No {provider} fixture for {endpoint} {key}")
+    if 'error' in fixture:
+        raise ReplayedProviderError(fixture['error'], fixture.get('status_code'))
+    return decode(fixture['response']) if decode else fixture['response']
+
+
+def _record(provider, endpoint, key, live, encode):
+    # The first response for a key is kept, so a later incremental fetch never
+    # replaces a full recorded window; delete the fixture to re-record it
+    path = fixture_path(provider, endpoint, key)
+    try:
+        result = live()
+    except Exception as e:
+        if not os.path.exists(path):
+            write_fixture(provider, endpoint, key, error=str(e), status_code=getattr(e, 'status_code', None))
+        raise
+    if not os.path.exists(path):
+        try:
+            write_fixture(provider, endpoint, key, response=encode(result) if encode else result)
+        except (TypeError, ValueError, OSError) as e:
+            logger.warning(f"Could not record {provider} {endpoint} fixture: {e}")
+    return result
+
+
+def through(provider, endpoint, key, live, encode=None, decode=None):
+    """
+    Route one provider call according to PROVIDER_MODE. `live()` performs the real
+    call (rate limiting and circuit-breaker bookkeeping included); `encode` and
+    `decode` convert its result to and from JSON when it is not JSON already.
+    In replay mode a missing fixture raises FixtureNotFound, which callers treat
+    like any other provider failure.
+    """
+    if PROVIDER_MODE == 'replay':
+        return _replay(provider, endpoint, key, decode)
+    if PROVIDER_MODE == 'record':
+        return _record(provider, endpoint, key, live, encode)
+    return live()
+
+
+class ReplayResponse:
+    """Enough of requests.Response for the MarketData service to consume a fixture."""
+
+    def __init__(self, status_code, payload):
+        self.status_code = status_code
+        self._payload = payload
+
+    def json(self):
+        return self._payload
+
+    @property
+    def text(self):
+        return json.dumps(self._payload)
+
+
+def encode_response(response):
+    try:
+        payload = response.json()
+    except ValueError:
+        payload = None
+    return {'status_code': response.status_code, 'json': payload}
+
+
+def decode_response(recorded):
+    return ReplayResponse(recorded['status_code'], recorded['json'])
@@ -0,0 +1,141 @@
+import os
+import time
+import threading
+import contextvars
+import logging
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+PRIORITY_INTERACTIVE = 0
+PRIORITY_SCANNER = 1
+PRIORITY_PREFETCH = 2
+PRIORITY_NAMES = ('interactive', 'scanner', 'prefetch')
+
+# Limits are per worker process, so the provider budget is split across gunicorn workers;
+# start.sh sets WEB_CONCURRENCY and launches gunicorn with that many workers
+WORKER_COUNT = max(1, int(os.environ.get('WEB_CONCURRENCY', 1)))
+PROVIDER_RATES_PER_MINUTE = {
+    'finnhub': float(os.environ.get('FINNHUB_RATE_PER_MIN', 60)),
+    'marketdata': float(os.environ.get('MARKETDATA_RATE_PER_MIN', 600)),
+    'fred': float(os.environ.get('FRED_RATE_PER_MIN', 120))
+}
+# How long an interactive call may queue before giving up; lower priorities queue indefinitely
+INTERACTIVE_WAIT_SECONDS = float(os.environ.get('INTERACTIVE_RATE_WAIT_SECONDS', 10))
+# Share of each bucket that only interactive calls may spend
+INTERACTIVE_RESERVE = float(os.environ.get('INTERACTIVE_RATE_RESERVE', 0.25))
+
+_current_priority = contextvars.ContextVar('request_priority', default=PRIORITY_INTERACTIVE)
+
+
+class RateLimitTimeout(Exception):
+    pass
+
+
+@contextmanager
+def request_priority(priority):
+    """Run provider calls made in this context (and threads it is copied into) at `priority`."""
+    token = _current_priority.set(priority)
+    try:
+        yield
+    finally:
+        _current_priority.reset(token)
+
+
+def current_priority():
+    return _current_priority.get()
+
+
+class ProviderBucket:
+    """
+    Token bucket for one provider with priority-ordered waiting.
+    A caller only takes a token when no higher-priority caller is queued, and
+    non-interactive callers leave the reserved share of the bucket untouched so
+    a scanner burst cannot starve interactive analyses.
+    """
+
+    def __init__(self, provider, rate_per_minute, capacity=None):
+        self.provider = provider
+        self.rate_per_second = rate_per_minute / 60.0
+        self.capacity = capacity or max(1.0, rate_per_minute / 4)
+        self.reserved = self.capacity * INTERACTIVE_RESERVE
+        self.tokens = self.capacity
+        self._updated = time.monotonic()
+        self._cond = threading.Condition()
+        self.waiting = [0] * len(PRIORITY_NAMES)
+        self.granted = [0] * len(PRIORITY_NAMES)
+        self.timeouts = [0] * len(PRIORITY_NAMES)
+        self.wait_seconds = [0.0] * len(PRIORITY_NAMES)
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate_per_second)
+        self._updated = now
+
+    def acquire(self, priority, timeout=None):
+        started = time.monotonic()
+        deadline = None if timeout is None else started + timeout
+        needed = 1.0 if priority == PRIORITY_INTERACTIVE else min(1.0 + self.reserved, self.capacity)
+
+        with self._cond:
+            self.waiting[priority] += 1
+            try:
+                while True:
+                    self._refill()
+                    if self.tokens >= needed and not any(self.waiting[:priority]):
+                        self.tokens -= 1.0
+                        self.granted[priority] += 1
+                        self.wait_seconds[priority] += time.monotonic() - started
+                        return True
+
+                    sleep_for = max((needed - self.tokens) / self.rate_per_second, 0.01)
+                    if deadline is not None:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            self.timeouts[priority] += 1
+                            return False
+                        sleep_for = min(sleep_for, remaining)
+                    self._cond.wait(sleep_for)
+            finally:
+                self.waiting[priority] -= 1
+                self._cond.notify_all()
+
+    def usage(self):
+        with self._cond:
+            self._refill()
+            return {
+                'rate_per_minute': round(self.rate_per_second * 60, 2),
+                'capacity': round(self.capacity, 2),
+                'tokens_available': round(self.tokens, 2),
+                'waiting': dict(zip(PRIORITY_NAMES, self.waiting)),
+                'granted': dict(zip(PRIORITY_NAMES, self.granted)),
+                'timeouts': dict(zip(PRIORITY_NAMES, self.timeouts)),
+                'avg_wait_seconds': {
+                    name: round(self.wait_seconds[i] / self.granted[i], 3) if self.granted[i] else 0
+                    for i, name in enumerate(PRIORITY_NAMES)
+                }
+            }
+
+
+buckets = {
+    provider: ProviderBucket(provider, rate / WORKER_COUNT)
+    for provider, rate in PROVIDER_RATES_PER_MINUTE.items()
+}
+
+
+def acquire(provider, priority=None):
+    """
+    Block until `provider` has budget for one call at the current priority.
+    Interactive calls raise RateLimitTimeout after INTERACTIVE_WAIT_SECONDS;
+    scanner and prefetch calls wait for as long as it takes.
+    """
+    if priority is None:
+        priority = current_priority()
+    timeout = INTERACTIVE_WAIT_SECONDS if priority == PRIORITY_INTERACTIVE else None
+    if not buckets[provider].acquire(priority, timeout=timeout):
+        logger.warning(f"{provider} rate budget exhausted for {PRIORITY_NAMES[priority]} call")
+        raise RateLimitTimeout(f"{provider} rate limit budget exhausted")
+
+
+def get_usage():
+    return {provider: bucket.usage() for provider, bucket in buckets.items()}
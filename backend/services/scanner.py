@@ -1,6 +1,7 @@
 import logging
 from datetime import datetime, date
 from models import db, Watchlist, ScanStaging
+from services.rate_limiter import request_priority, PRIORITY_SCANNER
 
 logger = logging.getLogger(__name__)
 
@@ -16,7 +17,12 @@ def get_direction_from_score(score: float) -> str:
         return 'Bearish'
 
 
-def run_scanner(analyze_func, category=None):
+def run_scanner(analyze_func, category=None, prepare_func=None):
+    """
+    Score every watchlist ticker (optionally one category) and stage the strong
+    bullish/bearish ones. `prepare_func(tickers)` may return per-ticker keyword
+    arguments for `analyze_func`, computed for the whole universe up front.
+    """
     results = {
         'scanned': 0,
         'bullish': 0,
@@ -39,10 +45,20 @@ def run_scanner(analyze_func, category=None):
     
     today = date.today()
     
+    prepared = {}
+    if prepare_func is not None:
+        try:
+            with request_priority(PRIORITY_SCANNER):
+                prepared = prepare_func([item.ticker.upper() for item in tickers])
+        except Exception as e:
+            logger.error(f"Scanner preparation failed, scoring tickers one by one: {e}")
+    
     for item in tickers:
         ticker = item.ticker.upper()
         try:
-            analysis = analyze_func(ticker)
+            # Scanner calls queue behind interactive analyses for provider budget
+            with request_priority(PRIORITY_SCANNER):
+                analysis = analyze_func(ticker, **prepared.get(ticker, {}))
             
             if not analysis or 'error' in analysis:
                 error_msg = analysis.get('error', 'Unknown error') if analysis else 'No response'
@@ -0,0 +1,153 @@
+import os
+import argparse
+import logging
+import numpy as np
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from itertools import repeat
+
+from services import candle_store
+from services.snapshots import save_npz_atomic, load_npz
+from technicals_batch import PANEL_COLUMNS, technicals_history
+from scoring_engine import macro_score_history
+
+logger = logging.getLogger(__name__)
+
+SCORE_HISTORY_FILE = os.environ.get(
+    'SCORE_HISTORY_FILE',
+    os.path.join(os.path.dirname(os.path.dirname(__file__)), 'data', 'score_history.npz')
+)
+SCORE_REPLAY_DAYS = int(os.environ.get('SCORE_REPLAY_DAYS', 730))
+SCORE_REPLAY_WORKERS = int(os.environ.get('SCORE_REPLAY_WORKERS', os.cpu_count() or 1))
+# Symbols per worker task: one vectorized panel each
+SCORE_REPLAY_CHUNK_SIZE = int(os.environ.get('SCORE_REPLAY_CHUNK_SIZE', 50))
+
+# Only these pillars have stored inputs to replay; analyst ratings, fundamentals and
+# the earnings calendar have no history, so no composite TickerGrade score is replayed
+PILLARS = ('technicals', 'macro')
+
+
+def stored_symbols():
+    """Every symbol with candles in the local candle store."""
+    if not os.path.isdir(candle_store.CANDLE_STORE_DIR):
+        return []
+    return sorted(name[:-4] for name in os.listdir(candle_store.CANDLE_STORE_DIR) if name.endswith('.npz'))
+
+
+def _replay_chunk(symbols, start):
+    """
+    Worker task: technicals scores for every stored bar of `symbols` dated on or
+    after `start`. Returns {symbol: (unix seconds, close, technicals score)}.
+    """
+    frames = {}
+    for symbol in symbols:
+        candles, _ = candle_store.load_candles(symbol)
+        if candles is None or len(candles) == 0:
+            logger.warning(f"Score replay: no stored candles for {symbol}")
+        elif all(column in candles.columns for column in PANEL_COLUMNS):
+            frames[symbol] = candles
+
+    replayed = {}
+    for symbol, scores in technicals_history(frames).items():
+        candles = frames[symbol]
+        keep = (candles['date'] >= start).to_numpy() & ~np.isnan(scores)
+        replayed[symbol] = (
+            candles['date'].values[keep].astype('datetime64[s]').astype(np.int64),
+            candles['close'].to_numpy(dtype=np.float64)[keep],
+            scores[keep]
+        )
+    return replayed
+
+
+def _macro_at(fred_df, dates):
+    """Macro score on each date (unix seconds), from the FRED rows up to and including that day."""
+    if fred_df is None or len(fred_df) == 0:
+        return np.full(len(dates), 5.0)
+    scores = macro_score_history(fred_df)
+    fred_days = pd.to_datetime(fred_df.index).tz_localize(None).normalize().values.astype('datetime64[D]')
+    rows = np.searchsorted(fred_days, dates.astype('datetime64[s]').astype('datetime64[D]'), side='right') - 1
+    # No FRED data yet on that day: score_macro's insufficient-data score
+    return np.where(rows >= 0, scores[np.maximum(rows, 0)], 5.0)
+
+
+def replay_scores(symbols, fred_df, days=SCORE_REPLAY_DAYS, workers=SCORE_REPLAY_WORKERS):
+    """
+    The daily technicals and macro pillar scores of `symbols` over the last
+    `days` days, replayed from the candle store and the FRED frame. Technicals
+    are scored as of each bar from the full stored history before it, macro
+    from the FRED rows up to that day. The other pillars (and so the final
+    score) have no stored inputs and are not replayed. Bars with too little
+    history to score technicals are left out.
+
+    Symbols are split into chunks of SCORE_REPLAY_CHUNK_SIZE, each scored as
+    one vectorized panel, on a process pool of `workers` processes.
+
+    Returns a columnar table: a dict of equal-length arrays (symbol, date in
+    unix seconds, close, technicals, macro), sorted by symbol then date.
+    """
+    symbols = [symbol.upper() for symbol in symbols]
+    start = pd.Timestamp(candle_store.window_start(days))
+    chunks = [symbols[i:i + SCORE_REPLAY_CHUNK_SIZE] for i in range(0, len(symbols), SCORE_REPLAY_CHUNK_SIZE)]
+
+    started = datetime.now()
+    if workers <= 1 or len(chunks) <= 1:
+        results = [_replay_chunk(chunk, start) for chunk in chunks]
+    else:
+        with ProcessPoolExecutor(max_workers=min(workers, len(chunks))) as pool:
+            results = list(pool.map(_replay_chunk, chunks, repeat(start)))
+
+    replayed = {}
+    for result in results:
+        replayed.update(result)
+    replayed = {symbol: replayed[symbol] for symbol in sorted(replayed)}
+
+    counts = [len(dates) for dates, _, _ in replayed.values()]
+    table = {
+        'symbol': np.repeat(np.array(list(replayed), dtype=str), counts),
+        'date': np.concatenate([dates for dates, _, _ in replayed.values()] or [np.empty(0, dtype=np.int64)]),
+        'close': np.concatenate([close for _, close, _ in replayed.values()] or [np.empty(0)]),
+        'technicals': np.concatenate([scores for _, _, scores in replayed.values()] or [np.empty(0)])
+    }
+    table['macro'] = _macro_at(fred_df, table['date'])
+
+    elapsed = (datetime.now() - started).total_seconds()
+    logger.info(f"Score replay: {len(replayed)} symbols, {len(table['date'])} rows in {elapsed:.1f}s")
+    return table
+
+
+def save_score_history(table, path=None):
+    """Write a replay table column-wise to the score history snapshot."""
+    save_npz_atomic(path or SCORE_HISTORY_FILE, generated_at=np.array(datetime.now().isoformat()), **table)
+
+
+def load_score_history(symbols=None, path=None):
+    """
+    The stored technicals and macro score history as a DataFrame (one row per
+    symbol and day, with a datetime 'date' column), optionally only for
+    `symbols`; None if no replay has been written yet.
+    """
+    arrays = load_npz(path or SCORE_HISTORY_FILE)
+    if arrays is None:
+        return None
+    arrays.pop('generated_at', None)
+    df = pd.DataFrame(arrays)
+    df['date'] = pd.to_datetime(df['date'], unit='s')
+    if symbols is not None:
+        df = df[df['symbol'].isin([symbol.upper() for symbol in symbols])].reset_index(drop=True)
+    return df
+
+
+if __name__ == '__main__':
+    # cd backend && python -m services.score_history [TICKER ...]
+    parser = argparse.ArgumentParser(description='Replay the daily technicals and macro scores from stored candles and FRED data.')
+    parser.add_argument('tickers', nargs='*', help='symbols to replay (default: every symbol in the candle store)')
+    parser.add_argument('--days', type=int, default=SCORE_REPLAY_DAYS)
+    parser.add_argument('--workers', type=int, default=SCORE_REPLAY_WORKERS)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    from data_services import get_fred_data
+    table = replay_scores(args.tickers or stored_symbols(), get_fred_data(), days=args.days, workers=args.workers)
+    save_score_history(table)
+    print(f"Wrote {len(table['date'])} rows for {len(set(table['symbol']))} symbols to {SCORE_HISTORY_FILE}")
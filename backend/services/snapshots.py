@@ -0,0 +1,64 @@
+import os
+import re
+import json
+import tempfile
+import numpy as np
+
+# Plain exchange symbols only ('BRK.B', 'BF-B'): anything else must never become a file name
+SYMBOL_PATTERN = re.compile(r'[A-Z0-9][A-Z0-9.\-]{0,9}')
+
+
+def _write_atomic(path, suffix, write):
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.tmp-', suffix=suffix)
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            write(f)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def save_npz_atomic(path, **arrays):
+    """
+    Write arrays to an .npz file atomically: the data goes to a temp file in the
+    same directory which is then renamed over the target, so concurrent readers
+    (other gunicorn workers) never see a half-written snapshot.
+    """
+    _write_atomic(path, '.npz', lambda f: np.savez(f, **arrays))
+
+
+def save_json_atomic(path, payload):
+    """Write a JSON document atomically, like save_npz_atomic."""
+    _write_atomic(path, '.json', lambda f: f.write(json.dumps(payload).encode('utf-8')))
+
+
+def load_npz(path):
+    """Load every array of an .npz snapshot into a dict, or None if it does not exist."""
+    if not os.path.exists(path):
+        return None
+    with np.load(path, allow_pickle=False) as data:
+        return {name: data[name] for name in data.files}
+
+
+def load_json(path):
+    """Load a JSON document, or None if it does not exist."""
+    if not os.path.exists(path):
+        return None
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def is_valid_symbol(symbol):
+    """True if `symbol` is a plain upper-case ticker that is safe to use as a file name."""
+    return isinstance(symbol, str) and SYMBOL_PATTERN.fullmatch(symbol) is not None
+
+
+def symbol_path(directory, symbol, suffix='.npz'):
+    """A symbol's snapshot file inside `directory`; raises ValueError for anything but a plain ticker."""
+    if not is_valid_symbol(symbol):
+        raise ValueError(f"Invalid symbol for a snapshot path: {symbol!r}")
+    return os.path.join(directory, f"{symbol}{suffix}")
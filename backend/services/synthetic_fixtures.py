@@ -0,0 +1,191 @@
+import os
+import json
+import argparse
+import logging
+import numpy as np
+import pandas as pd
+from datetime import datetime, timedelta
+from services import provider_replay
+from services.earnings_index import fetch_ranges
+from services.provider_replay import request_key, write_fixture
+
+logger = logging.getLogger(__name__)
+
+# Same series ids as data_services.FRED_SERIES, with a plausible level and daily volatility
+FRED_SYNTHETIC = {
+    'WALCL': (7000000.0, 0.002),
+    'WTREGEN': (800000.0, 0.02),
+    'RRPONTSYD': (500000.0, 0.03),
+    'BAMLH0A0HYM2': (3.5, 0.02)
+}
+
+
+def synthetic_tickers(count):
+    return [f"SYN{i:05d}" for i in range(count)]
+
+
+def _unix(dates):
+    return [int(ts.timestamp()) for ts in dates]
+
+
+def _random_candles(rng, dates):
+    start = rng.uniform(10, 500)
+    drift = rng.normal(0.0003, 0.0005)
+    close = start * np.exp(np.cumsum(rng.normal(drift, rng.uniform(0.01, 0.03), len(dates))))
+    open_ = np.concatenate([[start], close[:-1]]) * (1 + rng.normal(0, 0.003, len(dates)))
+    high = np.maximum(open_, close) * (1 + np.abs(rng.normal(0, 0.008, len(dates))))
+    low = np.minimum(open_, close) * (1 - np.abs(rng.normal(0, 0.008, len(dates))))
+    volume = rng.lognormal(np.log(rng.uniform(2e5, 2e7)), 0.4, len(dates)).astype(int)
+    return {
+        't': _unix(dates),
+        'o': np.round(open_, 2).tolist(),
+        'h': np.round(high, 2).tolist(),
+        'l': np.round(low, 2).tolist(),
+        'c': np.round(close, 2).tolist(),
+        'v': volume.tolist()
+    }
+
+
+def _marketdata(endpoint, path, params, payload):
+    write_fixture('marketdata', endpoint, request_key(path, params), response={'status_code': 200, 'json': payload})
+
+
+def _finnhub(method, payload, *args, **kwargs):
+    write_fixture('finnhub', method, request_key(*args, **kwargs), response=payload)
+
+
+def _write_ticker(ticker, rng, dates, today):
+    """Write every per-ticker fixture an analysis reads; returns the ticker's earnings report."""
+    bars = _random_candles(rng, dates)
+    close = bars['c']
+    change = close[-1] - close[-2]
+    year_highs, year_lows = bars['h'][-252:], bars['l'][-252:]
+
+    _marketdata('stocks/candles', f"stocks/candles/D/{ticker}", {'dateformat': 'unix'}, dict(bars, s='ok'))
+    _marketdata('stocks/quotes', f"stocks/quotes/{ticker}", {'52week': 'true'}, {
+        's': 'ok',
+        'last': [close[-1]],
+        'change': [round(change, 2)],
+        'changepct': [round(change / close[-2], 5)],
+        'volume': [bars['v'][-1]],
+        '52weekHigh': [max(year_highs)],
+        '52weekLow': [min(year_lows)]
+    })
+
+    report_date = today + timedelta(days=int(rng.integers(-5, 91)))
+    hour = 'bmo' if rng.random() < 0.5 else 'amc'
+    _marketdata('stocks/earnings', f"stocks/earnings/{ticker}", {}, {
+        's': 'ok',
+        'reportDate': [int(datetime.combine(report_date, datetime.min.time()).timestamp())],
+        'reportTime': ['Before Market Open' if hour == 'bmo' else 'After Market Close']
+    })
+
+    _finnhub('stock_candles', dict(bars, s='ok'), ticker, 'D')
+    _finnhub('symbol_lookup', {
+        'count': 1,
+        'result': [{'description': f"SYNTHETIC {ticker} CORP", 'displaySymbol': ticker, 'symbol': ticker, 'type': 'Common Stock'}]
+    }, ticker)
+
+    counts = rng.integers(0, 15, 5).tolist()
+    _finnhub('recommendation_trends', [{
+        'strongBuy': counts[0], 'buy': counts[1], 'hold': counts[2], 'sell': counts[3], 'strongSell': counts[4],
+        'period': today.replace(day=1).strftime('%Y-%m-%d'), 'symbol': ticker
+    }], ticker)
+
+    grades = ('Buy', 'Hold', 'Sell', 'Outperform', 'Neutral')
+    upgrades = []
+    for days_ago in sorted(rng.integers(1, 180, int(rng.integers(0, 6))).tolist()):
+        action = 'up' if rng.random() < 0.5 else 'down'
+        upgrades.append({
+            'symbol': ticker,
+            'gradeTime': (today - timedelta(days=days_ago)).strftime('%Y-%m-%d'),
+            'company': f"Broker {int(rng.integers(1, 40))}",
+            'fromGrade': grades[int(rng.integers(0, len(grades)))],
+            'toGrade': grades[int(rng.integers(0, len(grades)))],
+            'action': action
+        })
+    _finnhub('upgrade_downgrade', upgrades, symbol=ticker,
+             _from=(today - timedelta(days=180)).strftime('%Y-%m-%d'), to=today.strftime('%Y-%m-%d'))
+
+    mean_target = close[-1] * rng.uniform(0.8, 1.4)
+    _finnhub('price_target', {
+        'symbol': ticker,
+        'targetHigh': round(mean_target * 1.25, 2),
+        'targetLow': round(mean_target * 0.75, 2),
+        'targetMean': round(mean_target, 2),
+        'targetMedian': round(mean_target, 2),
+        'lastUpdated': today.strftime('%Y-%m-%d 00:00:00')
+    }, ticker)
+
+    pe = float(rng.uniform(5, 60))
+    _finnhub('company_basic_financials', {
+        'symbol': ticker,
+        'metricType': 'all',
+        'metric': {
+            'peBasicExclExtraTTM': round(pe, 2),
+            'peTTM': round(pe, 2),
+            'pegTTM': round(float(rng.uniform(0.3, 4)), 2),
+            'pbQuarterly': round(float(rng.uniform(0.5, 15)), 2),
+            'psTTM': round(float(rng.uniform(0.3, 20)), 2),
+            'dividendYieldIndicatedAnnual': round(float(rng.uniform(0, 5)), 2),
+            'beta': round(float(rng.uniform(0.4, 2.2)), 2),
+            'epsBasicExclExtraItemsTTM': round(close[-1] / pe, 2),
+            'revenuePerShareTTM': round(close[-1] / float(rng.uniform(0.5, 10)), 2)
+        }
+    }, ticker, 'all')
+
+    return {'symbol': ticker, 'date': report_date.strftime('%Y-%m-%d'), 'hour': hour}
+
+
+def _write_earnings_calendar(reports, today):
+    for from_date, to_date in fetch_ranges(today):
+        calendar = [report for report in reports if from_date <= report['date'] <= to_date]
+        _finnhub('earnings_calendar', {'earningsCalendar': calendar}, _from=from_date, to=to_date, symbol='')
+
+
+def _write_fred(rng, today, days):
+    dates = pd.bdate_range(today - timedelta(days=days), today)
+    for series_id, (level, volatility) in FRED_SYNTHETIC.items():
+        values = level * np.exp(np.cumsum(rng.normal(0, volatility, len(dates))))
+        write_fixture('fred', 'get_series', request_key(series_id), response={
+            'dates': [d.strftime('%Y-%m-%d') for d in dates],
+            'values': np.round(values, 4).tolist()
+        })
+
+
+def generate(count, days=730, seed=0):
+    """
+    Write replay fixtures for `count` synthetic tickers (SYN00000...) plus SPY:
+    candles over `days` days, quote, profile, analyst data, financials and
+    earnings, along with the bulk earnings calendar and the FRED series.
+    Deterministic for a given seed. Returns the generated tickers.
+    """
+    today = datetime.now().date()
+    dates = pd.bdate_range(today - timedelta(days=days), today)
+    tickers = synthetic_tickers(count) + ['SPY']
+
+    reports = []
+    for i, ticker in enumerate(tickers):
+        reports.append(_write_ticker(ticker, np.random.default_rng([seed, i]), dates, today))
+        if (i + 1) % 500 == 0:
+            logger.info(f"Synthetic fixtures: {i + 1}/{len(tickers)} tickers")
+    _write_earnings_calendar(reports, today)
+    _write_fred(np.random.default_rng([seed, len(tickers)]), today, days)
+
+    with open(os.path.join(provider_replay.PROVIDER_FIXTURE_DIR, 'synthetic_tickers.json'), 'w') as f:
+        json.dump(tickers, f)
+    return tickers
+
+
+if __name__ == '__main__':
+    # cd backend && python -m services.synthetic_fixtures --tickers 2000
+    # then run with PROVIDER_MODE=replay (and the same PROVIDER_FIXTURE_DIR)
+    parser = argparse.ArgumentParser(description='Generate synthetic provider fixtures for replay mode.')
+    parser.add_argument('--tickers', type=int, default=1000)
+    parser.add_argument('--days', type=int, default=730)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    generated = generate(args.tickers, days=args.days, seed=args.seed)
+    print(f"Wrote fixtures for {len(generated)} tickers to {provider_replay.PROVIDER_FIXTURE_DIR}")
@@ -0,0 +1,336 @@
+import numpy as np
+import pandas as pd
+import logging
+
+from scoring_engine import score_technicals, relative_extrema_mask
+
+logger = logging.getLogger(__name__)
+
+# Same thresholds and periods as scoring_engine.score_technicals
+MIN_HISTORY = 60
+RSI_PERIOD = 14
+DIVERGENCE_LOOKBACK = 30
+DIVERGENCE_ORDER = 5
+PANEL_COLUMNS = ('open', 'high', 'low', 'close', 'volume')
+
+INSUFFICIENT_DATA = {'error': 'Insufficient data (need 60+ days)'}
+
+
+def build_panel(frames):
+    """
+    Align per-symbol candle DataFrames into 2D (bars x symbols) arrays. Rows are
+    aligned on each symbol's most recent bar and shorter histories are front-padded
+    with NaN. Returns (symbols, {column: array}, lengths).
+    """
+    symbols = list(frames)
+    lengths = np.array([len(frames[symbol]) for symbol in symbols], dtype=np.int64)
+    rows = int(lengths.max()) if len(symbols) else 0
+    arrays = {column: np.full((rows, len(symbols)), np.nan) for column in PANEL_COLUMNS}
+    for j, symbol in enumerate(symbols):
+        df = frames[symbol]
+        for column in PANEL_COLUMNS:
+            arrays[column][rows - len(df):, j] = df[column].to_numpy(dtype=np.float64)
+    return symbols, arrays, lengths
+
+
+def _last_two(mask):
+    """Row of the last and second-to-last True per column (-1 where missing), and the True count."""
+    positions = np.where(mask, np.arange(mask.shape[0])[:, None], -1)
+    last = positions.max(axis=0)
+    previous = np.where(positions == last, -1, positions).max(axis=0)
+    return last, previous, mask.sum(axis=0)
+
+
+def _at(values, rows):
+    return np.take_along_axis(values, np.maximum(rows, 0)[None, :], axis=0)[0]
+
+
+def _extrema_mask(values, comparator):
+    return relative_extrema_mask(values, comparator, order=DIVERGENCE_ORDER)
+
+
+def detect_divergence(recent_prices, recent_rsi):
+    """Vectorized detect_rsi_divergence over (lookback x symbols) windows: 1 bullish, -1 bearish, 0 none."""
+    with np.errstate(invalid='ignore'):
+        price_low, price_low_prev, price_low_count = _last_two(_extrema_mask(recent_prices, np.less_equal))
+        price_high, price_high_prev, price_high_count = _last_two(_extrema_mask(recent_prices, np.greater_equal))
+        rsi_low_count = _extrema_mask(recent_rsi, np.less_equal).sum(axis=0)
+        rsi_high_count = _extrema_mask(recent_rsi, np.greater_equal).sum(axis=0)
+
+        bullish = (
+            (price_low_count >= 2) & (rsi_low_count >= 2) &
+            (_at(recent_prices, price_low) < _at(recent_prices, price_low_prev)) &
+            (_at(recent_rsi, price_low) > _at(recent_rsi, price_low_prev))
+        )
+        bearish = (
+            (price_high_count >= 2) & (rsi_high_count >= 2) &
+            (_at(recent_prices, price_high) > _at(recent_prices, price_high_prev)) &
+            (_at(recent_rsi, price_high) < _at(recent_rsi, price_high_prev))
+        )
+    return np.where(bullish, 1, np.where(bearish, -1, 0))
+
+
+def _oscillators(close, lengths):
+    """RSI, MACD line and MACD signal for every bar of a front-padded (bars x symbols) close array."""
+    rows = close.shape[0]
+    padding = np.arange(rows)[:, None] < (rows - lengths)[None, :]
+    close_frame = pd.DataFrame(close)
+
+    # RSI exactly as calculate_rsi_series; padded bars must not count as zero-change observations
+    delta = close_frame.diff()
+    gain = delta.where(delta > 0, 0).mask(padding)
+    loss = (-delta.where(delta < 0, 0)).mask(padding)
+    avg_gain = gain.ewm(alpha=1 / RSI_PERIOD, min_periods=RSI_PERIOD, adjust=False).mean()
+    avg_loss = loss.ewm(alpha=1 / RSI_PERIOD, min_periods=RSI_PERIOD, adjust=False).mean()
+    rsi = (100 - (100 / (1 + avg_gain / avg_loss))).to_numpy()
+
+    ema_fast = close_frame.ewm(span=12, min_periods=12, adjust=False).mean()
+    ema_slow = close_frame.ewm(span=26, min_periods=26, adjust=False).mean()
+    macd = ema_fast - ema_slow
+    signal = macd.ewm(span=9, min_periods=9, adjust=False).mean()
+    return rsi, macd.to_numpy(), signal.to_numpy()
+
+
+def compute_technicals_panel(open_, high, low, close, volume, lengths):
+    """
+    Every technicals indicator for all symbols in one vectorized pass over 2D
+    (bars x symbols) OHLCV arrays, front-padded with NaN to `lengths` real bars.
+    Returns the last-bar values score_technicals reads, one array per indicator.
+    """
+    rsi, macd, signal = _oscillators(close, lengths)
+
+    sma_volume_20 = pd.DataFrame(volume).rolling(20).mean().to_numpy()[-1]
+
+    previous_close = np.vstack([np.full((1, close.shape[1]), np.nan), close[:-1]])
+    true_range = np.fmax(np.fmax(high - low, np.abs(high - previous_close)), np.abs(low - previous_close))
+    atr_14 = pd.DataFrame(true_range).rolling(14).mean().to_numpy()[-1]
+
+    diff_today = macd[-1] - signal[-1]
+    diff_yesterday = macd[-2] - signal[-2]
+
+    return {
+        'current_price': close[-1],
+        'current_open': open_[-1],
+        'current_volume': volume[-1],
+        'rsi': rsi[-1],
+        'divergence': detect_divergence(close[-DIVERGENCE_LOOKBACK:], rsi[-DIVERGENCE_LOOKBACK:]),
+        'macd': macd[-1],
+        'macd_signal': signal[-1],
+        'golden_cross': (diff_today > 0) & (diff_yesterday <= 0),
+        'death_cross': (diff_today < 0) & (diff_yesterday >= 0),
+        'sma_volume_20': sma_volume_20,
+        'atr_14': atr_14,
+        'lowest_low_20': pd.DataFrame(low[-20:]).min().to_numpy()
+    }
+
+
+def technicals_from_values(values):
+    """score_technicals' scoring and details from one symbol's last-bar indicator values."""
+    score = 5.0
+    details = {}
+
+    current_price = float(values['current_price'])
+    details['current_price'] = round(current_price, 2)
+
+    rsi = float(values['rsi'])
+    details['rsi'] = round(rsi, 2)
+
+    divergence = values['divergence']
+    if divergence == 1:
+        score += 3.0
+        details['rsi_signal'] = 'Bullish Divergence'
+        details['divergence_detected'] = True
+        details.update({
+            'divergence_type': 'Bullish Divergence',
+            'price_pattern': 'Lower Low',
+            'rsi_pattern': 'Higher Low'
+        })
+    elif divergence == -1:
+        score -= 3.0
+        details['rsi_signal'] = 'Bearish Divergence'
+        details['divergence_detected'] = True
+        details.update({
+            'divergence_type': 'Bearish Divergence',
+            'price_pattern': 'Higher High',
+            'rsi_pattern': 'Lower High'
+        })
+    else:
+        details['divergence_detected'] = False
+        if 40 <= rsi <= 50:
+            score += 1.5
+            details['rsi_signal'] = 'Neutral-Bullish'
+        elif rsi > 75:
+            score -= 1.5
+            details['rsi_signal'] = 'Overextended'
+        elif rsi < 30:
+            score += 1.0
+            details['rsi_signal'] = 'Oversold'
+        elif rsi > 50 and rsi <= 75:
+            score += 1.0
+            details['rsi_signal'] = 'Momentum'
+        else:
+            details['rsi_signal'] = 'Neutral'
+
+    macd_line = float(values['macd'])
+    signal_line = float(values['macd_signal'])
+    details['macd'] = round(macd_line, 4)
+    details['macd_signal'] = round(signal_line, 4)
+
+    if values['golden_cross']:
+        score += 2.5
+        details['macd_bullish'] = True
+        details['macd_crossover'] = 'Golden Cross'
+    elif values['death_cross']:
+        score -= 2.0
+        details['macd_bullish'] = False
+        details['macd_crossover'] = 'Death Cross'
+    elif macd_line > signal_line:
+        score += 1.5
+        details['macd_bullish'] = True
+        details['macd_crossover'] = 'Above Signal'
+    else:
+        score -= 1.0
+        details['macd_bullish'] = False
+        details['macd_crossover'] = 'Below Signal'
+
+    current_volume = int(values['current_volume'])
+    sma_volume_20 = values['sma_volume_20']
+    current_open = float(values['current_open'])
+    is_green_day = current_price > current_open
+
+    details['current_volume'] = current_volume
+    details['sma_volume_20'] = int(sma_volume_20) if not np.isnan(sma_volume_20) else None
+    details['is_green_day'] = is_green_day
+
+    if current_volume > sma_volume_20 and is_green_day:
+        score += 1.5
+        details['volume_bullish'] = True
+        details['volume_signal'] = 'Strong Buying'
+    elif current_volume > sma_volume_20 and not is_green_day:
+        score -= 0.5
+        details['volume_bullish'] = False
+        details['volume_signal'] = 'Heavy Selling'
+    else:
+        details['volume_bullish'] = False
+        details['volume_signal'] = 'Low Volume'
+
+    atr_14 = values['atr_14']
+    lowest_low_20 = float(values['lowest_low_20'])
+    if not np.isnan(atr_14):
+        atr_stop = current_price - (atr_14 * 2.0)
+        stop_loss = min(atr_stop, lowest_low_20)
+        details['atr_14'] = round(float(atr_14), 2)
+        details['key_support_level'] = round(float(stop_loss), 2)
+    else:
+        details['key_support_level'] = round(lowest_low_20, 2)
+
+    score = max(0, min(10, score))
+    return round(score, 1), details
+
+
+def score_technicals_batch(frames):
+    """
+    score_technicals for a whole universe at once: {symbol: hist_df} in,
+    {symbol: (score, details)} out, with results identical to calling
+    score_technicals on each frame. Frames with full OHLCV history are scored
+    in one vectorized pass; the rest take the per-symbol path.
+    """
+    results = {}
+    batch = {}
+    for symbol, df in frames.items():
+        if df is None or len(df) < MIN_HISTORY:
+            results[symbol] = (5.0, dict(INSUFFICIENT_DATA))
+        elif all(column in df.columns for column in PANEL_COLUMNS):
+            batch[symbol] = df
+        else:
+            results[symbol] = score_technicals(df)
+
+    if batch:
+        symbols, arrays, lengths = build_panel(batch)
+        values = compute_technicals_panel(
+            arrays['open'], arrays['high'], arrays['low'], arrays['close'], arrays['volume'], lengths
+        )
+        for j, symbol in enumerate(symbols):
+            results[symbol] = technicals_from_values({name: column[j] for name, column in values.items()})
+        logger.info(f"Batch technicals: {len(symbols)} symbols x {arrays['close'].shape[0]} bars")
+
+    return {symbol: results[symbol] for symbol in frames}
+
+
+def _divergence_history(close, rsi):
+    """detect_divergence for the DIVERGENCE_LOOKBACK window ending at every bar (0 before the first full window)."""
+    rows, columns = close.shape
+    divergence = np.zeros((rows, columns), dtype=np.int64)
+    if rows < DIVERGENCE_LOOKBACK:
+        return divergence
+
+    def windows(values):
+        # (lookback x windows * symbols): one column per (window end, symbol)
+        view = np.lib.stride_tricks.sliding_window_view(values, DIVERGENCE_LOOKBACK, axis=0)
+        return view.reshape(-1, DIVERGENCE_LOOKBACK).T
+
+    found = detect_divergence(windows(close), windows(rsi))
+    divergence[DIVERGENCE_LOOKBACK - 1:] = found.reshape(rows - DIVERGENCE_LOOKBACK + 1, columns)
+    return divergence
+
+
+def _technicals_scores(values):
+    """technicals_from_values' score only, elementwise over arrays of indicator values."""
+    rsi = values['rsi']
+    with np.errstate(invalid='ignore'):
+        rsi_points = np.select(
+            [(rsi >= 40) & (rsi <= 50), rsi > 75, rsi < 30, (rsi > 50) & (rsi <= 75)],
+            [1.5, -1.5, 1.0, 1.0],
+            0.0
+        )
+        divergence = values['divergence']
+        score = 5.0 + np.where(divergence == 1, 3.0, np.where(divergence == -1, -3.0, rsi_points))
+
+        score += np.where(
+            values['golden_cross'], 2.5,
+            np.where(values['death_cross'], -2.0, np.where(values['macd'] > values['macd_signal'], 1.5, -1.0))
+        )
+
+        heavy_volume = np.trunc(values['current_volume']) > values['sma_volume_20']
+        is_green_day = values['current_price'] > values['current_open']
+        score += np.where(heavy_volume, np.where(is_green_day, 1.5, -0.5), 0.0)
+    return np.round(np.clip(score, 0, 10), 1)
+
+
+def technicals_history(frames):
+    """
+    The technicals score as of every bar, for a whole universe at once:
+    {symbol: hist_df} in, {symbol: scores} out, where scores[i] equals
+    score_technicals(hist_df.iloc[:i + 1])[0]. Bars with less than MIN_HISTORY
+    of history are NaN. Frames must carry every PANEL_COLUMNS column.
+    """
+    if not frames:
+        return {}
+    symbols, arrays, lengths = build_panel(frames)
+    close = arrays['close']
+    rsi, macd, signal = _oscillators(close, lengths)
+    diff = macd - signal
+    diff_previous = np.vstack([np.full((1, close.shape[1]), np.nan), diff[:-1]])
+
+    with np.errstate(invalid='ignore'):
+        scores = _technicals_scores({
+            'current_price': close,
+            'current_open': arrays['open'],
+            'current_volume': arrays['volume'],
+            'rsi': rsi,
+            'divergence': _divergence_history(close, rsi),
+            'macd': macd,
+            'macd_signal': signal,
+            'golden_cross': (diff > 0) & (diff_previous <= 0),
+            'death_cross': (diff < 0) & (diff_previous >= 0),
+            'sma_volume_20': pd.DataFrame(arrays['volume']).rolling(20).mean().to_numpy()
+        })
+
+    rows = close.shape[0]
+    history = {}
+    for j, symbol in enumerate(symbols):
+        symbol_scores = scores[rows - lengths[j]:, j].copy()
+        symbol_scores[:MIN_HISTORY - 1] = np.nan
+        history[symbol] = symbol_scores
+    logger.info(f"Technicals history: {len(symbols)} symbols x {rows} bars")
+    return history
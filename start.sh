@@ -1,4 +1,6 @@
 #!/bin/bash
-cd /home/runner/workspace/backend && gunicorn --bind=0.0.0.0:8000 --reuse-port --workers=2 app:app &
+# The rate limiter splits each provider budget across WEB_CONCURRENCY workers, so it must match --workers
+export WEB_CONCURRENCY=${WEB_CONCURRENCY:-2}
+cd /home/runner/workspace/backend && gunicorn --bind=0.0.0.0:8000 --reuse-port --workers=$WEB_CONCURRENCY app:app &
 sleep 3
 cd /home/runner/workspace/frontend && npm run start -- -p 5000